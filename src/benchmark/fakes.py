@@ -0,0 +1,170 @@
+"""
+Local stand-ins for the services the pipeline talks to, so it can be benchmarked without network access:
+
+- FakeReddit: a PRAW-like listing of video submissions pointing at local files
+- serve_folder: an HTTP server that yt-dlp downloads those files from
+- FakeYouTubeUploadServer: the resumable upload protocol of videos.insert
+- mock_s3: an in-process S3 backed by moto (optional dependency, `pip install moto`)
+"""
+import functools
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeSubmission:
+    def __init__(self, post_id, title, url, duration, width, height, has_audio):
+        self.id = post_id
+        self.title = title
+        self.url = url
+        self.is_video = True
+        self.media = {
+            "reddit_video": {
+                "duration": duration,
+                "width": width,
+                "height": height,
+                "has_audio": has_audio,
+                "dash_url": url,
+            }
+        }
+
+
+class FakeSubreddit:
+    def __init__(self, submissions):
+        self.submissions = submissions
+
+    def hot(self, limit=None, **kwargs):
+        return iter(self.submissions[:limit])
+
+    top = hot
+    rising = hot
+
+
+class FakeReddit:
+    """Returns the same listing for every subreddit name."""
+
+    def __init__(self, submissions):
+        self.listing = FakeSubreddit(submissions)
+
+    def subreddit(self, name):
+        return self.listing
+
+
+def make_submissions(clips, base_url):
+    """Build one submission per synthetic clip, as returned by synthetic.generate_clips."""
+    submissions = []
+    for index, (path, (width, height, _, duration, has_audio)) in enumerate(clips):
+        url = f"{base_url}/{os.path.basename(path)}"
+        submissions.append(FakeSubmission(f"bench{index}", f"Benchmark clip {index}", url, duration, width, height, has_audio))
+    return submissions
+
+
+@contextmanager
+def serve_folder(folder):
+    """Serve a folder over HTTP on a free local port. Yields the base URL."""
+    handler = functools.partial(QuietFileHandler, directory=folder)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class QuietFileHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeYouTubeUploadServer:
+    """
+    Implements the resumable upload protocol used by videos.insert.
+
+    The session is started with a POST that returns the session URI in the Location header. Chunks are
+    sent with PUT and Content-Range, and the server answers 308 with the committed Range until the last
+    byte arrives. Then it answers 200 with the video resource. bytes_received counts the media bytes.
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self.bytes_received = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, body=b"", headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                session_id = uuid.uuid4().hex
+                with fake.lock:
+                    fake.sessions[session_id] = 0
+                self._reply(200, headers={"Location": f"{fake.url}/upload/session/{session_id}"})
+
+            def do_PUT(self):
+                session_id = self.path.rsplit("/", 1)[-1]
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                content_range = self.headers.get("Content-Range", "")
+                total = content_range.rsplit("/", 1)[-1]
+                with fake.lock:
+                    fake.sessions[session_id] = fake.sessions.get(session_id, 0) + len(body)
+                    fake.bytes_received += len(body)
+                    received = fake.sessions[session_id]
+
+                if total != "*" and received >= int(total):
+                    video = {"id": f"fake{session_id[:11]}", "kind": "youtube#video"}
+                    self._reply(200, json.dumps(video).encode(), {"Content-Type": "application/json"})
+                elif received:
+                    self._reply(308, headers={"Range": f"bytes=0-{received - 1}"})
+                else:
+                    self._reply(308)
+
+        return Handler
+
+
+@contextmanager
+def mock_s3(bucket_name):
+    """Run the S3 client against moto's in-process S3 with the bucket already created."""
+    try:
+        from moto import mock_aws
+    except ImportError as e:
+        raise RuntimeError("The S3 stand-in needs moto: pip install moto") from e
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        import boto3
+        boto3.client("s3").create_bucket(Bucket=bucket_name)
+        yield
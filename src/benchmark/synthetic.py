@@ -0,0 +1,41 @@
+import os
+import subprocess
+
+# (width, height, frame rate, duration in seconds, has audio): a mix of landscape, portrait, odd frame rates
+# and silent clips, like a typical hot listing
+DEFAULT_CLIP_SPECS = [
+    (1280, 720, 30, 8, True),
+    (720, 1280, 60, 12, True),
+    (1920, 1080, 24, 6, True),
+    (640, 480, 25, 10, False),
+    (1080, 1080, 30, 9, True),
+    (854, 480, 29.97, 14, True),
+    (1920, 1080, 30, 5, True),
+    (480, 854, 30, 11, False),
+]
+
+# A different picture per clip, otherwise the repost check would keep only the first one
+VIDEO_SOURCES = ["testsrc2", "mandelbrot", "life", "cellauto", "smptebars", "testsrc", "rgbtestsrc", "sierpinski"]
+
+def generate_clip(output_path, width, height, frame_rate, duration, has_audio=True, source="testsrc2"):
+    """Render a synthetic clip with one of ffmpeg's lavfi test sources."""
+    command = [
+        "ffmpeg", "-v", "error",
+        "-f", "lavfi", "-t", str(duration), "-i", f"{source}=size={width}x{height}:rate={frame_rate}",
+    ]
+    if has_audio:
+        command += ["-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=44100:duration={duration}", "-c:a", "aac"]
+    command += ["-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", "-shortest", output_path, "-y"]
+    subprocess.run(command, check=True)
+    return output_path
+
+def generate_clips(folder, specs=DEFAULT_CLIP_SPECS):
+    """Render every spec into the folder. Returns a list of (path, spec) in spec order."""
+    os.makedirs(folder, exist_ok=True)
+    clips = []
+    for index, spec in enumerate(specs):
+        path = os.path.join(folder, f"clip_{index}.mp4")
+        if not os.path.exists(path):
+            generate_clip(path, *spec, source=VIDEO_SOURCES[index % len(VIDEO_SOURCES)])
+        clips.append((path, spec))
+    return clips
@@ -0,0 +1,107 @@
+"""
+Single entry point for the pipeline steps, so cron can run each one separately:
+
+    python main.py download <subreddit> <duration_in_seconds>
+    python main.py merge <folder>
+    python main.py upload [batch_file]
+    python main.py run
+
+To spread a run over several machines sharing the output folder, one coordinator enqueues it and any
+number of workers execute it:
+
+    python main.py coordinate [--no-wait]
+    python main.py worker [--processes N] [--exit-when-idle]
+    python main.py collect
+
+Each subcommand imports only the modules it needs. Reddit, S3 and YouTube clients, as well as moviepy,
+are loaded lazily on first use. Stage timings and counters of every command are written to output/metrics.
+"""
+import argparse
+import os
+from src.constants.constants import BATCH_UPLOAD_PATH, METRICS_FOLDER
+from src.util.metrics_util import metrics
+
+def download_command(args):
+    from src.controller.download_controller import download_controller
+    download_folder = download_controller(args.subreddit, args.duration)
+    print(f"✅ Total videos downloaded and saved in {download_folder}")
+
+def merge_command(args):
+    from src.controller.merge_controller import merge_controller
+    output_path = merge_controller(args.folder)
+    from src.client.s3_client import S3Client
+    S3Client.wait_for_uploads()
+    return 0 if output_path else 1
+
+def upload_command(args):
+    from src.scripts.batch_upload import run_batch_upload
+    video_urls = run_batch_upload(args.batch_file)
+    # Uploads deferred for lack of quota are not attempted, so they do not count as failures
+    return 0 if all(video_urls) else 1
+
+def run_command(args):
+    from src.controller.run_controller import run_controller
+    _, completed = run_controller()
+    return 0 if completed else 1
+
+def coordinate_command(args):
+    from src.controller.coordinator_controller import coordinator_controller
+    coordinator_controller(wait=not args.no_wait)
+
+def worker_command(args):
+    from src.controller.worker_controller import worker_controller
+    worker_controller(args.processes, args.exit_when_idle)
+
+def collect_command(args):
+    from src.controller.coordinator_controller import collect_controller
+    collect_controller()
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="main.py", description="Build Reddit video compilations.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    download_parser = subparsers.add_parser("download", help="Download the top videos of a subreddit")
+    download_parser.add_argument("subreddit")
+    download_parser.add_argument("duration", type=int, help="Total duration to collect, in seconds")
+    download_parser.set_defaults(handler=download_command)
+
+    merge_parser = subparsers.add_parser("merge", help="Stitch the videos of a download folder")
+    merge_parser.add_argument("folder")
+    merge_parser.set_defaults(handler=merge_command)
+
+    upload_parser = subparsers.add_parser("upload", help="Upload a batch of compilations to YouTube")
+    upload_parser.add_argument("batch_file", nargs="?", default=BATCH_UPLOAD_PATH)
+    upload_parser.set_defaults(handler=upload_command)
+
+    run_parser = subparsers.add_parser("run", help="Download and stitch every configured subreddit")
+    run_parser.set_defaults(handler=run_command)
+
+    coordinate_parser = subparsers.add_parser("coordinate", help="Enqueue a run for the workers and collect its results")
+    coordinate_parser.add_argument("--no-wait", action="store_true", help="Return right after enqueueing the run")
+    coordinate_parser.set_defaults(handler=coordinate_command)
+
+    worker_parser = subparsers.add_parser("worker", help="Run queued jobs on this machine")
+    worker_parser.add_argument("--processes", type=int, default=1, help="Number of worker processes to start")
+    worker_parser.add_argument("--exit-when-idle", action="store_true", help="Stop once no run has work left")
+    worker_parser.set_defaults(handler=worker_command)
+
+    collect_parser = subparsers.add_parser("collect", help="Write the batch upload file of the latest run")
+    collect_parser.set_defaults(handler=collect_command)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # Several workers share the metrics folder, so each one writes its own files
+    name = f"worker_{os.getpid()}" if args.command == "worker" else args.command
+    try:
+        return args.handler(args) or 0
+    finally:
+        # Written even when the command fails, that is when the timings matter most
+        metrics.export(
+            os.path.join(METRICS_FOLDER, f"{name}_report.json"),
+            os.path.join(METRICS_FOLDER, f"{name}.prom")
+        )
+
+if __name__ == "__main__":
+    raise SystemExit(main())
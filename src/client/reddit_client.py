@@ -1,13 +1,36 @@
 import os
-from src.constants.constants import REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT
+import shutil
+import collections
+import concurrent.futures
+from src.constants.constants import (
+    REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT, PENDING_DOWNLOADS_FOLDER,
+    MAX_CLIP_DURATION_IN_SECONDS, MAX_DOWNLOAD_WORKERS, REDDIT_REQUESTS_PER_SECOND, REDDIT_REQUEST_BURST,
+    MAX_DOWNLOAD_BYTES_PER_CLIP, MIN_AUDIO_BITRATE_KBPS, ENCODED_RESOLUTION, FRAME_RATE,
+    CANDIDATE_LISTINGS, CANDIDATE_WINDOW_PER_LISTING, CANDIDATE_TOP_TIME_FILTER, PACKING_SLACK_SECONDS,
+    PIPELINE_QUEUE_SIZE
+)
 import praw
-import yt_dlp
 import time
 from dotenv import load_dotenv
+from src.client.ytdlp_session import YtDlpSession
+from src.util.checkpoint_util import CheckpointUtil
 from src.util.config_util import ConfigUtil
-import random
+from src.util.format_util import FormatUtil
+from src.util.frame_hash_index import FrameHashIndex
+from src.util.metadata_store import MetadataStore
+from src.util.metrics_util import metrics
+from src.util.packing_util import PackingUtil
+from src.util.post_index import PostIndex
+from src.util.rate_limiter import TokenBucket
+from src.util.resource_scheduler import scheduler
+from src.util.scratch_space import scratch
 
 class RedditWrapper:
+    # Shared by every wrapper in the process so concurrent subreddits stay within Reddit's request budget together
+    rate_limiter = TokenBucket(REDDIT_REQUESTS_PER_SECOND, REDDIT_REQUEST_BURST)
+    # Shared as well, so a repost is caught even when another subreddit downloaded the original
+    frame_index = FrameHashIndex()
+
     def __init__(self):
         """Initialize Reddit API client and load environment variables."""
         # Load environment variables from .env file
@@ -27,83 +50,360 @@ class RedditWrapper:
             client_secret=self.CLIENT_SECRET,
             user_agent=self.USER_AGENT
         )
+
+        # Remembers posts across runs so known-bad posts are skipped and earlier downloads are reused
+        self.post_index = PostIndex()
         
-    def get_video_duration(self, url):
-        """Retrieve video duration using yt-dlp (returns duration in seconds)."""
-        ydl_opts = {
-            "quiet": True,
-            "skip_download": True,
-            "no_warnings": True,
-            "force_generic_extractor": False
-        }
+    def extract_video_info(self, url):
+        """Extract the yt-dlp info dict for a URL without downloading it (None on failure)."""
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                return info.get("duration", 0)
+            with YtDlpSession.acquire() as session:
+                return session.extract_info(url)
         except Exception as e:
             print(f"⚠️ Failed to get duration for {url}: {e}")
-            return 0
+            return None
 
-    def fetch_top_videos(self, subreddit_name: str, duration_in_seconds: int):
-        """Fetch and download videos while respecting Reddit's API limits."""
-        # Create folder for saving the downloaded videos
-        timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
-        download_folder = os.path.join("output", subreddit_name, timestamp)
-        
-        # Initialize total video duration and downloaded count
-        total_duration = 0
-        downloaded_count = 0
+    def get_video_duration(self, url):
+        """Retrieve video duration using yt-dlp (returns duration in seconds)."""
+        info = self.extract_video_info(url)
+        return info.get("duration", 0) if info else 0
+
+    @staticmethod
+    def get_reddit_video(post):
+        """Return the reddit_video block of a submission (or of the post it crossposts), if present."""
+        media = post.media or {}
+        if "reddit_video" in media:
+            return media["reddit_video"]
+        # Only cross-posts carry the list; getattr would make PRAW fetch the submission for every other post
+        for parent in vars(post).get("crosspost_parent_list") or []:
+            parent_media = parent.get("media") or {}
+            if "reddit_video" in parent_media:
+                return parent_media["reddit_video"]
+        return None
+
+    def get_video_metadata(self, post):
+        """
+        Describe a video post as a dict with duration, width, height, has_audio, download_url and info.
+
+        Reddit-hosted videos are described straight from the listing payload. Only other hosts are probed
+        with yt-dlp, and the extracted info is kept so the download does not have to extract it again.
+        """
+        reddit_video = self.get_reddit_video(post)
+        if reddit_video is not None:
+            return {
+                "duration": reddit_video.get("duration") or 0,
+                "width": reddit_video.get("width"),
+                "height": reddit_video.get("height"),
+                "has_audio": reddit_video.get("has_audio", True),
+                # The DASH manifest carries both audio and video and is served from v.redd.it, not the API
+                "download_url": reddit_video.get("dash_url") or reddit_video.get("hls_url") or post.url,
+                "info": None,
+            }
+
+        self.rate_limiter.acquire()
+        with scheduler.network(), metrics.span("probe"):
+            info = self.extract_video_info(post.url) or {}
+        return {
+            "duration": info.get("duration") or 0,
+            "width": info.get("width"),
+            "height": info.get("height"),
+            "has_audio": info.get("acodec") != "none",
+            "download_url": post.url,
+            "info": info or None,
+        }
+
+    def fetch_top_videos(self, subreddit_name: str, duration_in_seconds: int, on_clip_ready=None, download_folder=None):
+        """
+        Fetch and download videos while respecting Reddit's API limits.
 
+        The metadata of a window of hot, top and rising posts is gathered first. The clips that fill the
+        duration most closely with the best-scored posts are then picked, and only those are downloaded.
+
+        :param on_clip_ready: Optional callback(folder, filename, title) invoked as soon as each clip gets its
+            final number, so later stages can start before the whole folder is downloaded. It may block to
+            apply backpressure on the downloads.
+        :param download_folder: Folder of an interrupted run to continue. The clips it already holds count
+            towards the duration and are handed to on_clip_ready again.
+        """
+        if download_folder is None:
+            # Create folder for saving the downloaded videos
+            timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
+            download_folder = scratch.path(subreddit_name, timestamp)
+        pending_folder = os.path.join(download_folder, PENDING_DOWNLOADS_FOLDER)
+        os.makedirs(pending_folder, exist_ok=True)
+        CheckpointUtil.update_subreddit(subreddit_name, stage=CheckpointUtil.LISTED, folder=download_folder)
+
+        # Per-run state, kept local so one wrapper can serve several subreddits at once
+        run = {
+            "folder": download_folder,
+            "subreddit": subreddit_name,
+            "on_clip_ready": on_clip_ready,
+            "total_duration": 0,
+            "downloaded_count": 0,
+        }
+        downloaded_post_ids = self._resume_downloads(run)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS) as executor:
+            candidates = self._gather_candidates(subreddit_name, downloaded_post_ids, executor)
+
+            # A failed download frees its share of the budget, which the next round fills from the candidates left
+            while candidates:
+                budget = duration_in_seconds - run["total_duration"]
+                selected = self._select_clips(candidates, budget)
+                if not selected:
+                    break
+                candidates = [candidate for candidate in candidates if candidate not in selected]
+                if self._download_selected(selected, pending_folder, run, executor):
+                    break
+        # Counted once the rounds are over, as a candidate left out of one round may fill the next
+        metrics.increment("clips_skipped", len(candidates), reason="not_selected")
+        ConfigUtil.flush_metadata(download_folder)
+        shutil.rmtree(pending_folder, ignore_errors=True)
+        CheckpointUtil.update_subreddit(subreddit_name, stage=CheckpointUtil.DOWNLOADED)
+
+        print(f"✅ Total videos downloaded: {run['downloaded_count']} ({run['total_duration'] / 60:.2f} min)")
+        stats = YtDlpSession.stats()
+        print(f"🔌 yt-dlp sent {stats['requests']} requests over {stats['connections_opened']} connections, "
+              f"{stats['info_cache_hits']} extractions served from the cache")
+        print(f"📂 Videos saved in: {download_folder}")
+        return download_folder
+
+    def _gather_candidates(self, subreddit_name, downloaded_post_ids, executor):
+        """
+        Collect the video posts of the candidate window (hot, top and rising) with their metadata.
+
+        Posts the index already rejected, and clips too long or of unknown length, are left out.
+
+        :return: List of (post, video metadata) in listing order, without duplicates
+        """
         subreddit = self.reddit.subreddit(subreddit_name)
+        listings = {
+            "hot": lambda: subreddit.hot(limit=CANDIDATE_WINDOW_PER_LISTING),
+            "top": lambda: subreddit.top(time_filter=CANDIDATE_TOP_TIME_FILTER, limit=CANDIDATE_WINDOW_PER_LISTING),
+            "rising": lambda: subreddit.rising(limit=CANDIDATE_WINDOW_PER_LISTING),
+        }
 
-        for post in subreddit.hot():
-            if not post.is_video:
-                continue
-            print(f"🎬 Found video: {post.title}")
+        probes = []
+        seen = set(downloaded_post_ids)
+        for listing in CANDIDATE_LISTINGS:
+            for post in listings[listing]():
+                if not post.is_video:
+                    continue
+                # A cross-post is the same video as its parent, whichever of the two shows up first. Read from
+                # the listing payload, as a missing attribute makes PRAW fetch the whole submission
+                canonical_id = (vars(post).get("crosspost_parent") or post.id).split("_")[-1]
+                if post.id in seen or canonical_id in seen:
+                    continue
+                seen.update((post.id, canonical_id))
+                print(f"🎬 Found video: {post.title}")
+                entry = self.post_index.lookup(post.id, post.url)
+                if entry and entry["status"] != PostIndex.DOWNLOADED:
+                    print(f"⏭️ Skipping {post.url} (already {entry['status']})")
+                    metrics.increment("clips_skipped", reason=f"index_{entry['status']}")
+                    continue
+                if entry and entry["file_path"] and os.path.exists(entry["file_path"]):
+                    # Downloaded by an earlier run but never used in an episode
+                    probe = concurrent.futures.Future()
+                    probe.set_result({"duration": entry["duration"], "reuse_path": entry["file_path"]})
+                elif self.get_reddit_video(post) is not None:
+                    # Listing metadata is already in memory, no need to go through the pool
+                    probe = concurrent.futures.Future()
+                    probe.set_result(self.get_video_metadata(post))
+                else:
+                    probe = executor.submit(self.get_video_metadata, post)
+                probes.append((post, probe))
 
-            duration = self.get_video_duration(post.url)
-            if duration == 0 or duration > 30:
+        candidates = []
+        for post, probe in probes:
+            video = probe.result()
+            duration = video["duration"]
+            if duration == 0 or duration > MAX_CLIP_DURATION_IN_SECONDS:
                 print(f"⚠️ Skipping {post.url} (duration unknown or too long)")
+                metrics.increment("clips_skipped", reason="duration_unknown" if duration == 0 else "too_long")
+                self.post_index.record(post.id, post.url, subreddit_name, PostIndex.REJECTED, duration)
                 continue
-            
-            if total_duration + duration > duration_in_seconds:
-                print(f"⏹️ Stopping downloads: Reached {total_duration / 60:.2f} min of videos")
-                break
-
-            if self.download_video(post.url, download_folder, post.title, downloaded_count):
-                print(f"Downloaded video #{downloaded_count} - {post.title} with a duration of {duration}")
-                total_duration += duration
-                downloaded_count += 1
-                print(f"🕦 Current total duration (in seconds): {total_duration}")
-            else:
-                print(f"Unable to download video {post.title} with a duration of {duration}")
-
-            time.sleep(3)
-            
-
-        print(f"✅ Total videos downloaded: {downloaded_count} ({total_duration / 60:.2f} min)")
-        print(f"📂 Videos saved in: {download_folder}")
-        return download_folder
+            candidates.append((post, video))
+
+        print(f"🗂️ {len(candidates)} candidate clips for r/{subreddit_name}")
+        return candidates
+
+    @staticmethod
+    def _select_clips(candidates, budget):
+        """Pick the candidates that fill the budget most closely, favouring the best-scored posts."""
+        selection = PackingUtil.pack(
+            [video["duration"] for _, video in candidates],
+            [getattr(post, "score", 0) or 0 for post, _ in candidates],
+            budget,
+            PACKING_SLACK_SECONDS
+        )
+        return [candidates[index] for index in selection]
 
-    def download_video(self, url, folder, title, download_count):
-        """Download MP4 video with audio using yt-dlp."""
-        filename = f"{download_count}.mp4"
-        output_path = f"{folder}/{filename}"
+    def _download_selected(self, selected, pending_folder, run, executor):
+        """
+        Download the selected clips and commit them in listing order. Returns True when every clip was committed.
 
-        ydl_opts = {
-            "outtmpl": output_path,
-            "quiet": True,
-            "retries": 10,
+        At most MAX_DOWNLOAD_WORKERS + PIPELINE_QUEUE_SIZE downloads are in flight or waiting for their commit.
+        The next one is only submitted once the oldest is committed, so a blocking on_clip_ready holds back
+        the downloads as well.
+        """
+        window = MAX_DOWNLOAD_WORKERS + PIPELINE_QUEUE_SIZE
+        # Downloads only wait for scratch space when an encoder frees it as they go
+        admit = run["on_clip_ready"] is not None
+        pending_downloads = collections.deque()
+        all_committed = True
+        for post, video in selected:
+            if len(pending_downloads) >= window:
+                all_committed &= self._commit_download(pending_downloads.popleft(), run)
+            temp_path = os.path.join(pending_folder, f"{post.id}.mp4")
+            download = executor.submit(self._prepare_clip, video, temp_path, admit)
+            pending_downloads.append((post, video["duration"], temp_path, download))
+
+        # Committed in listing order, so clip numbers follow the listing whatever finishes first
+        while pending_downloads:
+            all_committed &= self._commit_download(pending_downloads.popleft(), run)
+        return all_committed
+
+    def _resume_downloads(self, run):
+        """Count the clips an interrupted run already committed to the folder. Returns their post ids."""
+        # A clip whose download was consumed by its encode only survives as the encode
+        clips = {
+            filename: clip for filename, clip in CheckpointUtil.get_clips(run["folder"]).items()
+            if os.path.exists(os.path.join(run["folder"], filename))
+            or (clip.get("stage") == CheckpointUtil.ENCODED and os.path.exists(clip["encoded_path"]))
         }
+        for filename in sorted(clips, key=lambda name: int(os.path.splitext(name)[0])):
+            clip = clips[filename]
+            scratch.track(os.path.join(run["folder"], filename), awaiting_encode=True)
+            # Titles are buffered before they reach metadata.jsonl, so a crash may have lost the last few
+            if MetadataStore.for_folder(run["folder"]).get(filename) is None:
+                ConfigUtil.save_metadata(run["folder"], filename, clip["title"])
+            if run["on_clip_ready"] is not None:
+                run["on_clip_ready"](run["folder"], filename, clip["title"])
+            run["total_duration"] += clip["duration"]
+            run["downloaded_count"] = int(os.path.splitext(filename)[0]) + 1
+
+        if clips:
+            print(f"↩️ Resuming {run['folder']} with {len(clips)} clips ({run['total_duration']} seconds)")
+        return {clip["post_id"] for clip in clips.values()}
+
+    def _fetch_video(self, video, output_path):
+        """Reuse an earlier download when the index has one, otherwise download within the rate limit."""
+        if video.get("reuse_path"):
+            try:
+                # Moved rather than copied, so the old folder does not keep a copy forever; a rename when it can be
+                shutil.move(video["reuse_path"], output_path)
+            except OSError as e:
+                print(f"⚠️ Could not reuse {video['reuse_path']}: {e}")
+                return False
+            self.post_index.release_file(video["reuse_path"])
+            print(f"♻️ Reusing earlier download {video['reuse_path']}")
+            metrics.increment("clips_reused")
+            return True
+
+        self.rate_limiter.acquire()
+        with scheduler.network(), metrics.span("download"):
+            return self.download_video(
+                video["download_url"], output_path, video["info"], self.required_height(video)
+            )
+
+    def _prepare_clip(self, video, output_path, admit=False):
+        """
+        Fetch a clip and hash its frames for the repost check, on a download worker.
+
+        :param admit: Wait for room in the scratch space budget before downloading
+        :return: False when the download failed, otherwise the frame hashes (None if the clip could not be hashed)
+        """
+        if admit:
+            scratch.wait_for_space()
+        if not self._fetch_video(video, output_path):
+            return False
+        with metrics.span("dedup_hash"):
+            return self.frame_index.hash_clip(output_path, video["duration"])
+
+    def _commit_download(self, pending_download, run):
+        """
+        Wait for a download and give it the next clip number. Returns False when the download failed or
+        the clip turned out to be a repost of one already downloaded.
+        """
+        post, duration, temp_path, download = pending_download
+        hashes = download.result()
+        if hashes is False:
+            print(f"Unable to download video {post.title} with a duration of {duration}")
+            metrics.increment("clips_skipped", reason="download_failed")
+            self.post_index.record(post.id, post.url, run["subreddit"], PostIndex.FAILED, duration)
+            return False
+
+        # Checked here rather than on the worker, so the earlier post in the listing is the one that stays
+        if hashes is not None:
+            original_id = self.frame_index.find_duplicate(post.id, hashes)
+            if original_id is not None:
+                print(f"⏭️ Skipping {post.url} (repost of {original_id})")
+                metrics.increment("clips_skipped", reason="duplicate")
+                self.post_index.record(post.id, post.url, run["subreddit"], PostIndex.REJECTED, duration)
+                os.remove(temp_path)
+                return False
+            self.frame_index.add(post.id, hashes)
+
+        folder = run["folder"]
+        filename = f"{run['downloaded_count']}.mp4"
+        file_path = os.path.join(folder, filename)
+        os.replace(temp_path, file_path)
+        scratch.track(file_path, awaiting_encode=True)
+        metrics.increment("clips_downloaded")
+        ConfigUtil.save_metadata(folder, filename, post.title)
+        CheckpointUtil.update_clip(
+            folder, filename, stage=CheckpointUtil.DOWNLOADED, post_id=post.id, title=post.title, duration=duration
+        )
+        self.post_index.record(post.id, post.url, run["subreddit"], PostIndex.DOWNLOADED, duration, file_path)
+        if run["on_clip_ready"] is not None:
+            run["on_clip_ready"](folder, filename, post.title)
+
+        print(f"Downloaded video #{run['downloaded_count']} - {post.title} with a duration of {duration}")
+        run["total_duration"] += duration
+        run["downloaded_count"] += 1
+        print(f"🕦 Current total duration (in seconds): {run['total_duration']}")
+        return True
+
+    @staticmethod
+    def required_height(video):
+        """The source height a clip needs so the encode at ENCODED_RESOLUTION never has to upscale it."""
+        target_width, target_height = map(int, ENCODED_RESOLUTION.split("x"))
+        return FormatUtil.on_screen_height(video.get("width"), video.get("height"), target_width, target_height)
+
+    def download_video(self, url, output_path, info=None, min_height=None):
+        """
+        Download MP4 video with audio using yt-dlp, reusing an already extracted info dict when given.
+
+        Only the cheapest video and audio streams that still reach min_height (ENCODED_RESOLUTION's height
+        by default) are fetched. Clips over MAX_DOWNLOAD_BYTES_PER_CLIP are not downloaded.
+        """
+        if min_height is None:
+            min_height = int(ENCODED_RESOLUTION.split("x")[1])
+        received = {}
+
+        def track_bytes(progress):
+            # Called per stream; a DASH clip finishes a video and an audio stream
+            if progress["status"] == "finished":
+                received[progress.get("filename")] = progress.get("total_bytes") or progress.get("downloaded_bytes") or 0
+
+        format_selector = FormatUtil.build_selector(
+            min_height, FRAME_RATE, MIN_AUDIO_BITRATE_KBPS, MAX_DOWNLOAD_BYTES_PER_CLIP
+        )
 
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-            print(f"✅ Downloaded: {url}")
-            ConfigUtil.save_metadata(folder, filename, title)
+            # A warm session skips the extractor setup and reuses its open connections to the host
+            with YtDlpSession.acquire() as session:
+                session.download(url, output_path, format_selector, track_bytes, info)
+            # yt-dlp skips formats over max_filesize without raising
+            if not os.path.exists(output_path):
+                print(f"⚠️ Skipped {url}: larger than {MAX_DOWNLOAD_BYTES_PER_CLIP // 1024 ** 2} MiB")
+                metrics.increment("clips_skipped", reason="too_large")
+                return False
+            clip_bytes = sum(received.values())
+            metrics.increment("bytes_downloaded", clip_bytes)
+            metrics.observe("clip_download_bytes", clip_bytes)
+            print(f"✅ Downloaded: {url} ({clip_bytes / 1024 ** 2:.1f} MiB)")
             return True
         except Exception as e:
             print(f"❌ Download failed for {url} | Error: {e}")
             return False
-
-
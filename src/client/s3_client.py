@@ -1,19 +1,62 @@
 import os
+import hashlib
+import threading
+import concurrent.futures
 import boto3
-from botocore.exceptions import NoCredentialsError, PartialCredentialsError
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError, NoCredentialsError, PartialCredentialsError
+from src.constants.constants import S3_MAX_CONCURRENCY, S3_MULTIPART_CHUNK_SIZE, S3_UPLOAD_WORKERS, S3_URI_PREFIX
+from src.util.metrics_util import metrics
+from src.util.resource_scheduler import scheduler
 
 class S3Client:
-    def __init__(self):
-        self.s3_client = boto3.client('s3')
+    # One pooled boto3 client and one background upload pool per process, shared by every S3Client
+    _shared_client = None
+    _client_lock = threading.Lock()
+    _upload_executor = concurrent.futures.ThreadPoolExecutor(max_workers=S3_UPLOAD_WORKERS)
+    _pending_uploads = []
+
+    def __init__(self, multipart_chunksize=S3_MULTIPART_CHUNK_SIZE, max_concurrency=S3_MAX_CONCURRENCY):
+        self.s3_client = self.get_shared_client()
         self.bucket_name = "rscraped"
-    
+        self.multipart_chunksize = multipart_chunksize
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_chunksize,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=True
+        )
+
+    @classmethod
+    def get_shared_client(cls):
+        """Create the boto3 client once, with a connection pool large enough for every upload thread."""
+        with cls._client_lock:
+            if cls._shared_client is None:
+                pool_size = S3_UPLOAD_WORKERS * S3_MAX_CONCURRENCY
+                cls._shared_client = boto3.client('s3', config=Config(max_pool_connections=pool_size))
+            return cls._shared_client
+
     def upload_to_s3(self, local_path):
-        """Upload file to S3."""
+        """Upload file to S3, skipping it when the object already holds the same content."""
         s3_path = self.get_postfix_after_output(local_path)
         try:
-            with open(local_path, "rb") as f:
-                self.s3_client.upload_fileobj(f, self.bucket_name, s3_path)
+            with metrics.span("s3_checksum"):
+                etag, sha256 = self.compute_checksums(local_path)
+            if self.is_unchanged(s3_path, etag, sha256):
+                print(f"⏭️ {local_path} is unchanged in S3 at {s3_path}, skipping upload")
+                metrics.increment("uploads_skipped", reason="unchanged", target="s3")
+                return True
+
+            with scheduler.network(), metrics.span("s3_upload"):
+                self.s3_client.upload_file(
+                    local_path, self.bucket_name, s3_path,
+                    ExtraArgs={"Metadata": {"sha256": sha256}},
+                    Config=self.transfer_config
+                )
+            metrics.increment("bytes_uploaded", os.path.getsize(local_path), target="s3")
             print(f"✅ Successfully uploaded {local_path} to S3 at {s3_path}")
+            return True
         except FileNotFoundError:
             print(f"❌ File not found: {local_path}")
         except NoCredentialsError:
@@ -21,7 +64,96 @@ class S3Client:
         except PartialCredentialsError:
             print("❌ Incomplete AWS credentials.")
         except Exception as e:
-            print(f"❌ Failed to upload {local_path} to S3: {e}") 
+            print(f"❌ Failed to upload {local_path} to S3: {e}")
+        return False
+
+    def upload_stream(self, stream, local_path):
+        """
+        Upload a binary stream as a multipart upload to the key local_path would have, without a local file.
+
+        Parts are read off the stream as it is produced, so at most max_concurrency parts are held in memory.
+        There is no change detection, the content is only known once the stream ends.
+
+        :return: S3 URI of the object, or None on failure
+        """
+        s3_path = self.get_postfix_after_output(local_path)
+        try:
+            with scheduler.network(), metrics.span("s3_upload", mode="stream"):
+                self.s3_client.upload_fileobj(
+                    stream, self.bucket_name, s3_path, Config=self.transfer_config,
+                    Callback=lambda sent: metrics.increment("bytes_uploaded", sent, target="s3")
+                )
+            s3_uri = f"{S3_URI_PREFIX}{self.bucket_name}/{s3_path}"
+            print(f"✅ Successfully streamed {s3_uri}")
+            return s3_uri
+        except Exception as e:
+            print(f"❌ Failed to stream {s3_path} to S3: {e}")
+            return None
+
+    def download_from_s3(self, s3_uri):
+        """
+        Fetch an object uploaded by upload_stream back to its place under output/. Returns the local path, or None.
+
+        A complete earlier copy is reused.
+        """
+        bucket, s3_path = s3_uri[len(S3_URI_PREFIX):].split("/", 1)
+        local_path = os.path.join("output", s3_path)
+        try:
+            size = self.s3_client.head_object(Bucket=bucket, Key=s3_path)["ContentLength"]
+            if os.path.exists(local_path) and os.path.getsize(local_path) == size:
+                return local_path
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            with scheduler.network(), metrics.span("s3_download"):
+                self.s3_client.download_file(bucket, s3_path, local_path, Config=self.transfer_config)
+            return local_path
+        except Exception as e:
+            print(f"❌ Failed to download {s3_uri}: {e}")
+            return None
+
+    def upload_to_s3_async(self, local_path):
+        """Upload in the background so the caller can move on. Returns a Future resolving to upload_to_s3's result."""
+        future = self._upload_executor.submit(self.upload_to_s3, local_path)
+        with self._client_lock:
+            self._pending_uploads.append(future)
+        return future
+
+    @classmethod
+    def wait_for_uploads(cls):
+        """Block until every background upload started in this process has finished."""
+        with cls._client_lock:
+            pending, cls._pending_uploads = cls._pending_uploads, []
+        concurrent.futures.wait(pending)
+
+    def compute_checksums(self, local_path):
+        """
+        Return (etag, sha256) for a local file.
+
+        The ETag follows S3's scheme for the configured chunk size: the MD5 of the file for single-part
+        uploads, and the MD5 of the part MD5s with a "-<parts>" suffix for multipart uploads.
+        """
+        sha256 = hashlib.sha256()
+        part_md5s = []
+        with open(local_path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.multipart_chunksize), b""):
+                sha256.update(chunk)
+                part_md5s.append(hashlib.md5(chunk).digest())
+
+        if len(part_md5s) <= 1 and os.path.getsize(local_path) < self.multipart_chunksize:
+            etag = (part_md5s[0] if part_md5s else hashlib.md5(b"").digest()).hex()
+        else:
+            etag = f"{hashlib.md5(b''.join(part_md5s)).hexdigest()}-{len(part_md5s)}"
+        return etag, sha256.hexdigest()
+
+    def is_unchanged(self, s3_path, etag, sha256):
+        """Check whether the object at s3_path already holds the content described by the checksums."""
+        try:
+            head = self.s3_client.head_object(Bucket=self.bucket_name, Key=s3_path)
+        except ClientError:
+            # Missing object, or no permission to inspect it: upload either way
+            return False
+        if head.get("Metadata", {}).get("sha256") == sha256:
+            return True
+        return head.get("ETag", "").strip('"') == etag
 
     @staticmethod
     def get_postfix_after_output(file_path):
@@ -33,4 +165,4 @@ class S3Client:
             postfix = os.path.sep.join(parts[output_index + 1:])
             return postfix
         except ValueError:
-            return "output" 
\ No newline at end of file
+            return "output"
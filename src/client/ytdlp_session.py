@@ -0,0 +1,153 @@
+import copy
+import queue
+import threading
+import time
+from contextlib import contextmanager
+import yt_dlp
+from yt_dlp.cookies import YoutubeDLCookieJar
+from src.constants.constants import DOWNLOAD_FRAGMENT_CONCURRENCY, MAX_DOWNLOAD_BYTES_PER_CLIP, YTDLP_INFO_CACHE_TTL_SECONDS
+from src.util.metrics_util import metrics
+
+class YtDlpSession:
+    """
+    A long-lived yt-dlp downloader, lent to one probe or download at a time.
+
+    A YoutubeDL created per call pays for its setup and opens fresh HTTP connections, each with its own
+    TLS handshake, which is most of the fetch time of a short clip. A session keeps its YoutubeDL, and
+    with it the keep-alive connection pool of its HTTP handler, for the life of the process. Idle
+    sessions wait in a pool, so concurrent downloads never share one (YoutubeDL is not thread-safe)
+    while the next download, on whichever thread, gets the most recently used one. Every session
+    shares one cookie jar.
+
+    Extracted info dicts are cached by URL for YTDLP_INFO_CACHE_TTL_SECONDS, so a probe, the download
+    that follows it and any retry during the run extract once.
+    """
+    cookiejar = YoutubeDLCookieJar()
+    idle_sessions = queue.LifoQueue()
+    info_cache = {}
+    cache_lock = threading.Lock()
+
+    def __init__(self):
+        self.ydl = yt_dlp.YoutubeDL({
+            "quiet": True,
+            "no_warnings": True,
+            "retries": 10,
+            "merge_output_format": "mp4",
+            "max_filesize": MAX_DOWNLOAD_BYTES_PER_CLIP,
+            "concurrent_fragment_downloads": DOWNLOAD_FRAGMENT_CONCURRENCY,
+            "progress_hooks": [self._on_progress],
+        })
+        # Computed on first use otherwise; set before the first request opens a connection with its own jar
+        self.ydl.cookiejar = YtDlpSession.cookiejar
+        self.progress_hook = None
+        self.pool_counts = {}
+
+    @classmethod
+    @contextmanager
+    def acquire(cls):
+        """Borrow an idle session, or start one when all of them are busy."""
+        try:
+            session = cls.idle_sessions.get_nowait()
+        except queue.Empty:
+            session = cls()
+            metrics.increment("ytdlp_sessions_created")
+        try:
+            yield session
+        finally:
+            session.record_connections()
+            cls.idle_sessions.put(session)
+
+    def _on_progress(self, progress):
+        if self.progress_hook is not None:
+            self.progress_hook(progress)
+
+    def extract_info(self, url):
+        """Info dict of a URL without downloading it, from the cache when this run extracted it already."""
+        now = time.time()
+        with self.cache_lock:
+            cached = self.info_cache.get(url)
+        if cached is not None and now - cached[0] < YTDLP_INFO_CACHE_TTL_SECONDS:
+            metrics.increment("ytdlp_info_cache_hits")
+            return copy.deepcopy(cached[1])
+
+        # Extraction must not pick formats with the selector of the last download
+        self.ydl.format_selector = None
+        with metrics.span("ytdlp_extract"):
+            info = self.ydl.extract_info(url, download=False)
+        with self.cache_lock:
+            self.info_cache[url] = (now, info)
+            # Keeps a long-lived worker's cache from growing run after run
+            for expired_url in [key for key, (extracted_at, _) in self.info_cache.items() if now - extracted_at >= YTDLP_INFO_CACHE_TTL_SECONDS]:
+                del self.info_cache[expired_url]
+        # Handed out as a copy, as processing a download writes into the info dict
+        return copy.deepcopy(info)
+
+    def download(self, url, output_path, format_selector, progress_hook=None, info=None):
+        """
+        Download a URL, or an info dict extracted earlier, to output_path. Raises on failure like YoutubeDL.
+
+        :param format_selector: yt-dlp format selector, a callable like FormatUtil.build_selector returns
+        :param progress_hook: Optional callback receiving yt-dlp's progress dicts for this download only
+        """
+        info = info or self.extract_info(url)
+        self.ydl.params["outtmpl"]["default"] = output_path
+        self.ydl.format_selector = format_selector
+        self.progress_hook = progress_hook
+        try:
+            self.ydl.process_ie_result(info, download=True)
+        finally:
+            self.progress_hook = None
+            self.ydl.format_selector = None
+
+    def _http_sessions(self):
+        """
+        The requests sessions yt-dlp opened so far, which hold the connection pools.
+
+        yt-dlp has no public hook for its connections, so this reads the internals of the pinned version;
+        tests/test_ytdlp_session.py fails when an upgrade moves them.
+        """
+        director = self.ydl.__dict__.get("_request_director")
+        if director is None:
+            # No request went out yet
+            return []
+        # Handlers keep one HTTP session per cookie jar; only the requests handler pools connections
+        return [
+            http_session
+            for handler in director.handlers.values()
+            for _, http_session in getattr(handler, "_InstanceStoreMixin__instances", [])
+        ]
+
+    def record_connections(self):
+        """Add the connections opened and the requests sent since the last call to the metrics."""
+        opened = sent = 0
+        for http_session in self._http_sessions():
+            adapters = {id(adapter): adapter for adapter in getattr(http_session, "adapters", {}).values()}
+            for adapter in adapters.values():
+                pools = adapter.poolmanager.pools
+                for pool_key in list(pools.keys()):
+                    pool = pools.get(pool_key)
+                    if pool is None:
+                        continue
+                    counts = (pool.num_connections, pool.num_requests)
+                    previous = self.pool_counts.get((id(http_session), pool_key), (0, 0))
+                    # A pool evicted and created again starts counting from zero
+                    if counts[0] < previous[0] or counts[1] < previous[1]:
+                        previous = (0, 0)
+                    opened += counts[0] - previous[0]
+                    sent += counts[1] - previous[1]
+                    self.pool_counts[(id(http_session), pool_key)] = counts
+        metrics.increment("http_connections_opened", opened, client="yt-dlp")
+        metrics.increment("http_requests", sent, client="yt-dlp")
+
+    @staticmethod
+    def stats():
+        """Connection reuse and info cache statistics of every session in this process."""
+        connections = metrics.counter("http_connections_opened", client="yt-dlp")
+        requests = metrics.counter("http_requests", client="yt-dlp")
+        return {
+            "sessions": metrics.counter("ytdlp_sessions_created"),
+            "connections_opened": connections,
+            "requests": requests,
+            "requests_on_reused_connections": max(0, requests - connections),
+            "info_cache_hits": metrics.counter("ytdlp_info_cache_hits"),
+        }
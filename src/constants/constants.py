@@ -5,3 +5,90 @@ DURATION_IN_SECONDS_KEY = "duration_in_seconds"
 REDDIT_CLIENT_ID = "REDDIT_CLIENT_ID"
 REDDIT_CLIENT_SECRET ="REDDIT_CLIENT_SECRET"
 REDDIT_USER_AGENT = "REDDIT_USER_AGENT"
+PENDING_DOWNLOADS_FOLDER = ".pending"
+MAX_CLIP_DURATION_IN_SECONDS = 30
+MAX_DOWNLOAD_WORKERS = 4
+# Reddit allows 100 requests per minute for OAuth clients, stay slightly below that
+REDDIT_REQUESTS_PER_SECOND = 1.5
+REDDIT_REQUEST_BURST = 5
+TRANSCODE_CACHE_DIR = "output/.transcode_cache"
+TRANSCODE_CACHE_MAX_BYTES = 20 * 1024 ** 3
+CAPTION_CACHE_DIR = "output/.caption_cache"
+CAPTION_CACHE_MAX_BYTES = 256 * 1024 ** 2
+# Downloads pause while the downloads not yet encoded take more than this
+SCRATCH_BUDGET_BYTES = 20 * 1024 ** 3
+SCRATCH_ADMISSION_TIMEOUT_SECONDS = 600
+# e.g. "/dev/shm" to keep downloads and encodes in memory; compilations still go to output/
+SCRATCH_TMPFS_ROOT = None
+DELETE_CONSUMED_INTERMEDIATES = True
+# Pipe the final join (fragmented MP4) straight into the S3 multipart upload instead of writing result.mp4
+STREAM_RESULT_TO_S3 = False
+POST_INDEX_PATH = "output/post_index.db"
+# Posts used in an episode never expire
+POST_INDEX_TTL_SECONDS = {
+    "rejected": 7 * 24 * 3600,
+    "failed": 6 * 3600,
+    "downloaded": 7 * 24 * 3600,
+}
+# Stream each clip to the encoders as soon as it is downloaded instead of running the stages one after another
+STREAMING_PIPELINE = True
+PIPELINE_QUEUE_SIZE = 4
+# Subreddits processed at the same time; encodes and network transfers share the resource scheduler budgets
+MAX_CONCURRENT_SUBREDDITS = 8
+FFMPEG_THREADS_PER_JOB = 2
+NETWORK_SLOTS_PER_CORE = 2
+S3_MULTIPART_CHUNK_SIZE = 64 * 1024 ** 2
+S3_MAX_CONCURRENCY = 8
+S3_UPLOAD_WORKERS = 4
+# Compilations streamed to S3 are recorded by their URI instead of a local path
+S3_URI_PREFIX = "s3://"
+UPLOAD_STATE_PATH = "output/upload_state.json"
+YOUTUBE_DAILY_QUOTA = 10000
+YOUTUBE_INSERT_QUOTA_COST = 1600
+YOUTUBE_UPLOAD_CHUNK_SIZE = 16 * 1024 ** 2
+YOUTUBE_MAX_PARALLEL_UPLOADS = 3
+YOUTUBE_UPLOAD_MAX_RETRIES = 10
+# Point the YouTube client at another host, e.g. a local fake of the upload endpoint
+YOUTUBE_API_ENDPOINT = "YOUTUBE_API_ENDPOINT"
+YOUTUBE_TOKEN_PATH = "src/configs/token.json"
+YOUTUBE_DISCOVERY_PATH = "output/youtube_v3_discovery.json"
+YOUTUBE_DISCOVERY_MAX_AGE_SECONDS = 7 * 24 * 3600
+YOUTUBE_DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/youtube/v3/rest"
+METADATA_FILENAME = "metadata.jsonl"
+LEGACY_METADATA_FILENAME = "metadata.json"
+METADATA_BATCH_SIZE = 16
+METRICS_PREFIX = "redditcompilations"
+# Every CLI subcommand writes <command>_report.json and <command>.prom here. Point node_exporter's
+# --collector.textfile.directory at this folder to scrape the .prom files
+METRICS_FOLDER = "output/metrics"
+CHECKPOINT_PATH = "output/checkpoint.json"
+CLIP_CHECKPOINT_PATH = "output/clip_checkpoints.db"
+# Clips are scaled into the encode resolution, so larger downloads only cost bandwidth
+MAX_DOWNLOAD_BYTES_PER_CLIP = 200 * 1024 ** 2
+DOWNLOAD_FRAGMENT_CONCURRENCY = 4
+# Extracted yt-dlp info dicts are reused for this long, so probes and retries within a run extract once
+YTDLP_INFO_CACHE_TTL_SECONDS = 3600
+MIN_AUDIO_BITRATE_KBPS = 128
+# Every clip is encoded to this format; downloads only need to reach it
+ENCODED_RESOLUTION = "1920x1080"
+FRAME_RATE = 30
+# Listings whose video posts form the candidate window the clips are picked from
+CANDIDATE_LISTINGS = ("hot", "top", "rising")
+CANDIDATE_WINDOW_PER_LISTING = 50
+CANDIDATE_TOP_TIME_FILTER = "week"
+# Seconds of the duration budget that may stay empty in exchange for better scored clips
+PACKING_SLACK_SECONDS = 5
+FRAME_HASH_INDEX_PATH = "output/frame_hashes.db"
+FRAME_HASH_TTL_SECONDS = 90 * 24 * 3600
+# Reposts are compared on this many evenly spaced frames, each scaled to DEDUP_FRAME_SIZE squared grayscale
+DEDUP_FRAMES_PER_CLIP = 5
+DEDUP_FRAME_SIZE = 32
+# Average number of differing bits (out of 64 per frame) up to which two clips count as the same video
+DEDUP_MAX_DISTANCE = 10
+# Distributed mode: the coordinator and all workers share this queue, so it must live on a disk they all see
+JOB_QUEUE_PATH = "output/job_queue.db"
+JOB_LEASE_SECONDS = 300
+JOB_HEARTBEAT_SECONDS = 60
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_BACKOFF_SECONDS = 30
+WORKER_POLL_SECONDS = 5
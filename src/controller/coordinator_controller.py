@@ -0,0 +1,91 @@
+import time
+from src.constants.constants import BATCH_UPLOAD_PATH, OUTPUT_PATH_KEY, UPLOAD_DETAILS_KEY, WORKER_POLL_SECONDS
+from src.util.config_util import ConfigUtil
+from src.util.file_util import FileUtil
+from src.util.job_queue import JobQueue
+from src.util.post_index import PostIndex
+
+def enqueue_run(queue):
+    """Snapshot the subreddit config into a new run, with a download and a stitch job per subreddit."""
+    subreddit_details = ConfigUtil.load_subreddit_config()
+    # Once per run, so expired posts do not pile up in the index the workers share
+    PostIndex().prune()
+    jobs = []
+    for subreddit_name, upload_details in subreddit_details.items():
+        payload = {"upload_details": upload_details}
+        jobs.append(JobQueue.make_job(JobQueue.DOWNLOAD, subreddit_name, subreddit_name, payload))
+        # Waits for the encode jobs the download enqueues, since it has a later stage in the same group
+        jobs.append(JobQueue.make_job(JobQueue.STITCH, subreddit_name, subreddit_name, payload))
+    run_id = queue.create_run(subreddit_details, jobs)
+    print(f"📋 Enqueued run {run_id} for {len(subreddit_details)} subreddits")
+    return run_id, subreddit_details
+
+def write_batch_upload(queue, run_id, subreddit_names):
+    """Rewrite the batch upload file with every subreddit stitched so far, in config order."""
+    batch_uploads = []
+    for subreddit_name in subreddit_names:
+        for stitched in queue.results(run_id, subreddit_name, JobQueue.STITCH):
+            if stitched["output_path"]:
+                batch_uploads.append({OUTPUT_PATH_KEY: stitched["output_path"], UPLOAD_DETAILS_KEY: stitched["upload_details"]})
+    FileUtil.write_json_atomically(BATCH_UPLOAD_PATH, batch_uploads)
+    return batch_uploads
+
+def collect_run(queue, run_id, config):
+    """
+    Apply the finished stitch jobs of a run: increment each subreddit's episode once and rewrite the batch file.
+
+    Only the coordinator writes the config and the batch upload file, so workers on other machines never race on them.
+    """
+    for stitched in queue.uncollected(run_id, JobQueue.STITCH):
+        subreddit_name = stitched["group"]
+        episode = stitched["payload"]["upload_details"]["episode"]
+        # Skipped when a crash came between the increment and marking the job collected
+        current = ConfigUtil.load_subreddit_config().get(subreddit_name, {})
+        if stitched["result"]["output_path"] and current.get("episode") == episode:
+            ConfigUtil.increment_episode(subreddit_name, stitched["result"]["folder"])
+        queue.mark_collected(stitched["id"])
+    return write_batch_upload(queue, run_id, list(config))
+
+def collect_controller():
+    """Collect the latest run once, e.g. after a coordinator started with --no-wait."""
+    queue = JobQueue()
+    latest = queue.latest_run()
+    if latest is None:
+        print("No run has been enqueued yet")
+        return []
+    run_id, config = latest
+    batch_uploads = collect_run(queue, run_id, config)
+    state = "finished" if queue.is_finished(run_id) else "still running"
+    print(f"✅ Run {run_id} is {state}, {len(batch_uploads)} compilations in {BATCH_UPLOAD_PATH}")
+    return batch_uploads
+
+def coordinator_controller(wait=True):
+    """
+    Enqueue a run for the workers, or resume following the unfinished one, and collect it as it completes.
+
+    :param wait: Follow the run until every job is done or failed; otherwise return right after enqueueing
+    :return: The batch upload entries collected so far
+    """
+    queue = JobQueue()
+    latest = queue.latest_run()
+    if latest and not queue.is_finished(latest[0]):
+        run_id, config = latest
+        print(f"↩️ Following the unfinished run {run_id}")
+    else:
+        run_id, config = enqueue_run(queue)
+
+    if not wait:
+        return collect_run(queue, run_id, config)
+
+    counts = None
+    while not queue.is_finished(run_id):
+        collect_run(queue, run_id, config)
+        if queue.status_counts(run_id) != counts:
+            counts = queue.status_counts(run_id)
+            print(f"📊 Run {run_id}: {', '.join(f'{count} {status}' for status, count in sorted(counts.items()))}")
+        time.sleep(WORKER_POLL_SECONDS)
+
+    batch_uploads = collect_run(queue, run_id, config)
+    counts = queue.status_counts(run_id)
+    print(f"✅ Run {run_id} finished with {counts.get(JobQueue.FAILED, 0)} failed jobs, {len(batch_uploads)} compilations to upload")
+    return batch_uploads
@@ -1,11 +1,11 @@
 from src.handler.download_handler import fetch_top_videos
 
-def download_controller(subreddit_name, duration_in_seconds):
+def download_controller(subreddit_name, duration_in_seconds, download_folder=None):
     if not subreddit_name or not duration_in_seconds:
         raise ValueError("Missing required parameters")
     
     print(f"👀 Fetching videos for subreddit r/{subreddit_name}")
-    return fetch_top_videos(subreddit_name, duration_in_seconds)
+    return fetch_top_videos(subreddit_name, duration_in_seconds, download_folder=download_folder)
 
 if __name__ == "__main__":
     subreddit_name = input("Enter subreddit name: ")
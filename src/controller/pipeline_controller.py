@@ -0,0 +1,18 @@
+from src.handler.pipeline_handler import run_streaming_pipeline
+
+def pipeline_controller(subreddit_name, duration_in_seconds, download_folder=None):
+    """Download, encode and stitch a subreddit with the stages overlapping. Returns (download folder, output path)."""
+    if not subreddit_name or not duration_in_seconds:
+        raise ValueError("Missing required parameters")
+
+    print(f"👀 Streaming videos for subreddit r/{subreddit_name}")
+    return run_streaming_pipeline(subreddit_name, duration_in_seconds, download_folder)
+
+if __name__ == "__main__":
+    subreddit_name = input("Enter subreddit name: ")
+    duration_in_seconds = int(input("Enter duration in seconds: "))
+    try:
+        download_folder, output_path = pipeline_controller(subreddit_name, duration_in_seconds)
+        print(f"✅ Videos from {download_folder} stitched into {output_path}")
+    except ValueError as e:
+        print(f"Error: {e}")
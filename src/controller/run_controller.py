@@ -0,0 +1,116 @@
+import os
+import threading
+import concurrent.futures
+from src.constants.constants import BATCH_UPLOAD_PATH, DURATION_IN_SECONDS_KEY, MAX_CONCURRENT_SUBREDDITS, OUTPUT_PATH_KEY, S3_URI_PREFIX, STREAMING_PIPELINE, UPLOAD_DETAILS_KEY
+from src.controller.download_controller import download_controller
+from src.controller.merge_controller import merge_controller
+from src.controller.pipeline_controller import pipeline_controller
+from src.util.checkpoint_util import CheckpointUtil
+from src.util.config_util import ConfigUtil
+from src.util.file_util import FileUtil
+from src.util.metrics_util import metrics
+from src.util.post_index import PostIndex
+
+# Subreddits finish concurrently and each one rewrites the batch upload file
+batch_upload_lock = threading.Lock()
+
+def build_compilation(subreddit_name, upload_details, checkpoint):
+    """Run steps 2 and 3 for a subreddit, starting at the first stage its checkpoint does not cover."""
+    folder = checkpoint["folder"] if checkpoint["folder"] and os.path.isdir(checkpoint["folder"]) else None
+    stage = checkpoint["stage"] if folder else None
+
+    output_path = checkpoint["output_path"]
+    streamed = bool(output_path) and output_path.startswith(S3_URI_PREFIX)
+    if stage == CheckpointUtil.STITCHED and output_path and (streamed or os.path.exists(output_path)):
+        print(f"↩️ r/{subreddit_name} was already stitched into {output_path}")
+        if not streamed:
+            # The background S3 upload may not have finished before the crash; unchanged objects are skipped
+            from src.client.s3_client import S3Client
+            S3Client().upload_to_s3_async(output_path)
+        return folder, output_path
+
+    if stage == CheckpointUtil.DOWNLOADED:
+        print(f"↩️ r/{subreddit_name} was already downloaded into {folder}")
+        download_folder, output_path = folder, merge_controller(folder)
+    elif STREAMING_PIPELINE:
+        # Steps 2 and 3 overlap: each clip is re-encoded while the next ones download
+        download_folder, output_path = pipeline_controller(subreddit_name, upload_details[DURATION_IN_SECONDS_KEY], folder)
+    else:
+        # Step 2: Call fetch_top_videos from RedditWrapper to download the videos
+        download_folder = download_controller(subreddit_name, upload_details[DURATION_IN_SECONDS_KEY], folder)
+
+        # Step 3: Stitch and re-encode downloaded videos
+        output_path = merge_controller(download_folder)
+
+    CheckpointUtil.update_subreddit(subreddit_name, stage=CheckpointUtil.STITCHED, output_path=output_path)
+    return download_folder, output_path
+
+def process_subreddit(subreddit_name, upload_details):
+    """Download, stitch and record one subreddit. Returns its batch upload entry, or None on failure."""
+    try:
+        checkpoint = CheckpointUtil.resume_subreddit(subreddit_name, upload_details["episode"])
+        if checkpoint["stage"] in (CheckpointUtil.RECORDED, CheckpointUtil.UPLOADED):
+            print(f"↩️ r/{subreddit_name} is already in the batch upload file")
+        else:
+            with metrics.span("subreddit", subreddit=subreddit_name):
+                download_folder, output_path = build_compilation(subreddit_name, upload_details, checkpoint)
+            # The episode in the entry is the one this compilation was made for, even when resuming after the increment
+            batch_entry = {OUTPUT_PATH_KEY: output_path, UPLOAD_DETAILS_KEY: {**upload_details, "episode": checkpoint["episode"]}}
+            CheckpointUtil.update_subreddit(subreddit_name, stage=CheckpointUtil.RECORDED, folder=download_folder, batch_entry=batch_entry)
+            checkpoint = {**checkpoint, "folder": download_folder, "batch_entry": batch_entry}
+
+        # Step 4: Increment episode for next time, unless a crash came right after it last time
+        if upload_details["episode"] == checkpoint["episode"]:
+            ConfigUtil.increment_episode(subreddit_name, checkpoint["folder"])
+
+        return checkpoint["batch_entry"]
+
+    except Exception as e:
+        print(f"Error processing {subreddit_name}: {e}")
+        metrics.increment("subreddits_failed")
+        return None
+
+def write_batch_upload(subreddit_names):
+    """Rewrite the batch upload file with every subreddit recorded so far, in config order."""
+    with batch_upload_lock:
+        batch_uploads = CheckpointUtil.batch_entries(subreddit_names)
+        FileUtil.write_json_atomically(BATCH_UPLOAD_PATH, batch_uploads)
+        return batch_uploads
+
+def run_controller():
+    """
+    Process every configured subreddit and write the batch upload file, resuming an interrupted run.
+
+    :return: (batch upload entries, whether every subreddit succeeded)
+    """
+    # Step 1: Load the subreddit configs
+    subreddit_details = ConfigUtil.load_subreddit_config()
+    subreddit_names = list(subreddit_details)
+    if CheckpointUtil.start_run():
+        print("↩️ Resuming the interrupted run")
+    PostIndex().prune()
+
+    # Subreddits run concurrently; encodes and network transfers are throttled by the shared resource scheduler
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_CONCURRENT_SUBREDDITS) as executor:
+        futures = [
+            executor.submit(process_subreddit, subreddit_name, upload_details)
+            for subreddit_name, upload_details in subreddit_details.items()
+        ]
+        # Step 5: Every finished subreddit is written to the batch upload file right away, so a crash loses none
+        for future in futures:
+            future.add_done_callback(lambda _: write_batch_upload(subreddit_names))
+        completed = all(future.result() for future in futures)
+
+    # Kept in config order so batch_upload.json does not depend on which subreddit finished first
+    batch_uploads = write_batch_upload(subreddit_names)
+
+    # Step 6: Let the background S3 uploads finish before exiting
+    from src.client.s3_client import S3Client
+    S3Client.wait_for_uploads()
+
+    # Closed even when subreddits failed: the next run retries them from their checkpoints, while the
+    # others move on to their next episode. Only a crash leaves the run open to be resumed
+    CheckpointUtil.finish_run()
+    if not completed:
+        print("⚠️ Some subreddits failed, the next run retries them from their checkpoints")
+    return batch_uploads, completed
@@ -1,4 +1,6 @@
+import os
 import sys
+from src.constants.constants import S3_URI_PREFIX
 from src.handler.upload_handler import upload_video
 
 def upload_controller(file_path, upload_details, youtube_credentials):
@@ -7,4 +9,15 @@ def upload_controller(file_path, upload_details, youtube_credentials):
         print("Error: Missing required parameters")
         sys.exit(1)
 
-    return upload_video(youtube_credentials, file_path, upload_details)
\ No newline at end of file
+    if not file_path.startswith(S3_URI_PREFIX):
+        return upload_video(youtube_credentials, file_path, upload_details)
+
+    # Streamed compilations only exist in S3; the local copy lives until YouTube has it
+    from src.client.s3_client import S3Client
+    local_path = S3Client().download_from_s3(file_path)
+    if local_path is None:
+        return None
+    video_url = upload_video(youtube_credentials, local_path, upload_details)
+    if video_url:
+        os.remove(local_path)
+    return video_url
\ No newline at end of file
@@ -0,0 +1,93 @@
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from src.constants.constants import JOB_HEARTBEAT_SECONDS, METRICS_FOLDER, WORKER_POLL_SECONDS
+from src.util.job_queue import JobQueue
+from src.util.metrics_util import metrics
+
+def keep_lease(queue, job, worker_id, stop):
+    """Heartbeat the job until it is done, so a long encode is not mistaken for a dead worker."""
+    while not stop.wait(JOB_HEARTBEAT_SECONDS):
+        if not queue.heartbeat(job, worker_id):
+            print(f"⚠️ Lost the lease on {job['job_key']}, another worker took it over")
+            return
+
+def run_job(queue, job, worker_id, handlers):
+    """Run one claimed job and record its result or failure in the queue."""
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=keep_lease, args=(queue, job, worker_id, stop), daemon=True)
+    heartbeat.start()
+    try:
+        print(f"🔧 {worker_id} runs {job['job_key']} (attempt {job['attempts']}/{job['max_attempts']})")
+        with metrics.span("job", kind=job["kind"]):
+            result, follow_ups = handlers[job["kind"]](queue, job)
+    except Exception as e:
+        stop.set()
+        retry = queue.fail(job, worker_id, e)
+        metrics.increment("jobs_failed", kind=job["kind"], final=str(not retry).lower())
+        print(f"❌ {job['job_key']} failed{', will retry' if retry else ' for good'}: {e}")
+        return False
+    stop.set()
+
+    if not queue.complete(job, worker_id, result, follow_ups):
+        # The lease expired during the job and someone else owns it now; their result wins
+        print(f"⚠️ Dropping the result of {job['job_key']}, its lease was lost")
+        return False
+    metrics.increment("jobs_completed", kind=job["kind"])
+    return True
+
+def worker_loop(exit_when_idle=False, handlers=None, queue_path=None):
+    """
+    Claim and run jobs until stopped, or until no run has work left when exit_when_idle is set.
+
+    :return: Number of jobs this worker completed
+    """
+    if handlers is None:
+        # Imported here, so the pipeline modules load in the worker process rather than in the one spawning it
+        from src.handler.job_handler import JOB_HANDLERS
+        handlers = JOB_HANDLERS
+    queue = JobQueue(queue_path) if queue_path else JobQueue()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    completed = 0
+
+    print(f"👷 Worker {worker_id} is polling for jobs")
+    while True:
+        job = queue.claim(worker_id)
+        if job is None:
+            if exit_when_idle and not queue.has_open_runs():
+                print(f"✅ Worker {worker_id} is done, {completed} jobs completed")
+                return completed
+            time.sleep(WORKER_POLL_SECONDS)
+            continue
+        completed += run_job(queue, job, worker_id, handlers)
+
+def worker_process(exit_when_idle=False, handlers=None, queue_path=None):
+    """Entry point of a spawned worker process, which writes its own metrics."""
+    try:
+        worker_loop(exit_when_idle, handlers, queue_path)
+    finally:
+        name = f"worker_{os.getpid()}"
+        metrics.export(os.path.join(METRICS_FOLDER, f"{name}_report.json"), os.path.join(METRICS_FOLDER, f"{name}.prom"))
+
+def worker_controller(processes=1, exit_when_idle=False, handlers=None, queue_path=None):
+    """
+    Run workers on this machine. Start this on every machine that shares the queue database and the output folder.
+
+    With more than one process, each worker gets its own interpreter (spawned, not forked, so none inherits
+    another's SQLite connections or client sessions) and this process only waits for them.
+    """
+    if processes <= 1:
+        return worker_loop(exit_when_idle, handlers, queue_path)
+
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=worker_process, args=(exit_when_idle, handlers, queue_path), name=f"worker-{index}")
+        for index in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return all(worker.exitcode == 0 for worker in workers)
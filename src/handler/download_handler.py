@@ -1,10 +1,22 @@
-from src.client.reddit_client import RedditWrapper
+import threading
+from src.util.metrics_util import metrics
 
-# Initialize RedditWrapper
-reddit_wrapper = RedditWrapper()
+# PRAW is not thread safe, so every thread that processes a subreddit gets its own RedditWrapper
+_local = threading.local()
 
-def fetch_top_videos(subreddit_name, duration_in_seconds):
-    """Fetch and download videos while respecting Reddit's API limits."""
-    download_folder = reddit_wrapper.fetch_top_videos(subreddit_name, duration_in_seconds)
+def get_reddit_wrapper():
+    """Return the RedditWrapper of the current thread, creating it on first use."""
+    if not hasattr(_local, "reddit_wrapper"):
+        # Imported here so loading this module does not pull in PRAW, yt-dlp and the .env file
+        from src.client.reddit_client import RedditWrapper
+        _local.reddit_wrapper = RedditWrapper()
+    return _local.reddit_wrapper
+
+def fetch_top_videos(subreddit_name, duration_in_seconds, on_clip_ready=None, download_folder=None):
+    """Fetch and download videos while respecting Reddit's API limits, continuing download_folder when given."""
+    with metrics.span("fetch", subreddit=subreddit_name):
+        download_folder = get_reddit_wrapper().fetch_top_videos(
+            subreddit_name, duration_in_seconds, on_clip_ready, download_folder
+        )
     print(f"✅ Total videos downloaded and saved in {download_folder}")
     return download_folder
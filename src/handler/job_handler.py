@@ -0,0 +1,79 @@
+import os
+from src.constants.constants import DURATION_IN_SECONDS_KEY
+from src.util.job_queue import JobQueue
+
+# Every handler takes (queue, job) and returns (result, follow-up jobs). Raising fails the attempt.
+
+def run_download_job(queue, job):
+    """Download a subreddit's clips and enqueue one encode job per clip."""
+    from src.handler.download_handler import fetch_top_videos
+    from src.handler.merge_handler import clip_sort_key
+    from src.util.metadata_store import MetadataStore
+
+    subreddit_name = job["group_key"]
+    upload_details = job["payload"]["upload_details"]
+    # A retry starts a new folder; the post index lets it copy the clips the failed attempt already fetched
+    download_folder = fetch_top_videos(subreddit_name, upload_details[DURATION_IN_SECONDS_KEY])
+
+    metadata = MetadataStore.for_folder(download_folder)
+    clips = sorted(
+        (f for f in os.listdir(download_folder) if f.lower().endswith(".mp4") and not f.startswith("reencoded_")),
+        key=clip_sort_key
+    )
+    encode_jobs = [
+        JobQueue.make_job(JobQueue.ENCODE, subreddit_name, f"{subreddit_name}/{filename}", {
+            "folder": download_folder, "filename": filename, "title": metadata.get(filename, "Unknown Title"),
+        })
+        for filename in clips
+    ]
+    return {"folder": download_folder, "clips": clips}, encode_jobs
+
+def run_encode_job(queue, job):
+    """Re-encode one clip; any worker can take it, whichever machine downloaded the subreddit."""
+    from src.handler.merge_handler import encode_clip
+
+    payload = job["payload"]
+    encoded_path = encode_clip(payload["folder"], payload["filename"], payload["title"])
+    if encoded_path is None:
+        raise RuntimeError(f"Encoding {payload['filename']} failed")
+    return {"filename": payload["filename"], "encoded_path": encoded_path}, []
+
+def run_stitch_job(queue, job):
+    """Join the encoded clips of a subreddit once all its encode jobs are finished, then enqueue the S3 upload."""
+    from src.handler.merge_handler import assemble_compilation, clip_sort_key
+    from src.util.metadata_store import MetadataStore
+
+    downloads = queue.results(job["run_id"], job["group_key"], JobQueue.DOWNLOAD)
+    if not downloads:
+        raise RuntimeError(f"r/{job['group_key']} has no finished download")
+    download_folder = downloads[0]["folder"]
+
+    # Encodes that failed for good are left out, like clips stitch_videos_in_folder cannot re-encode
+    encodes = sorted(queue.results(job["run_id"], job["group_key"], JobQueue.ENCODE), key=lambda e: clip_sort_key(e["filename"]))
+    output_path = None
+    if encodes:
+        output_path = assemble_compilation(
+            download_folder, [e["encoded_path"] for e in encodes], MetadataStore.for_folder(download_folder), upload=False
+        )
+
+    follow_ups = []
+    if output_path:
+        follow_ups.append(JobQueue.make_job(JobQueue.UPLOAD, job["group_key"], job["group_key"], {"output_path": output_path}))
+    # The upload details are the config snapshot of the run, with the episode this compilation was made for
+    return {"folder": download_folder, "output_path": output_path, "upload_details": job["payload"]["upload_details"]}, follow_ups
+
+def run_upload_job(queue, job):
+    """Upload a stitched compilation to S3."""
+    from src.client.s3_client import S3Client
+
+    output_path = job["payload"]["output_path"]
+    if not S3Client().upload_to_s3(output_path):
+        raise RuntimeError(f"Uploading {output_path} to S3 failed")
+    return {"output_path": output_path}, []
+
+JOB_HANDLERS = {
+    JobQueue.DOWNLOAD: run_download_job,
+    JobQueue.ENCODE: run_encode_job,
+    JobQueue.STITCH: run_stitch_job,
+    JobQueue.UPLOAD: run_upload_job,
+}
@@ -1,53 +1,170 @@
 import os
-import json
-import subprocess
 import concurrent.futures
-from moviepy.editor import VideoFileClip, concatenate_videoclips, TextClip, CompositeVideoClip, ColorClip
-from src.client.s3_client import S3Client
+from functools import lru_cache
+from src.constants.constants import (
+    CAPTION_CACHE_DIR, CAPTION_CACHE_MAX_BYTES, ENCODED_RESOLUTION, FRAME_RATE, STREAM_RESULT_TO_S3,
+    TRANSCODE_CACHE_DIR, TRANSCODE_CACHE_MAX_BYTES
+)
+from src.util.caption_cache import CaptionCache
+from src.util.checkpoint_util import CheckpointUtil
+from src.util.ffmpeg_util import FFmpegUtil
+from src.util.metadata_store import MetadataStore
+from src.util.metrics_util import metrics
+from src.util.post_index import PostIndex
+from src.util.resource_scheduler import scheduler
+from src.util.scratch_space import scratch
+from src.util.transcode_cache import TranscodeCache
 
 # Configuration
-ENCODED_RESOLUTION = "1920x1080"
-FRAME_RATE = 30
-THREADS = 8 
+AUDIO_SAMPLE_RATE = 48000
+VIDEO_CODEC = "libx264"
+VIDEO_PRESET = "fast"
+PIXEL_FORMAT = "yuv420p"
+AUDIO_CODEC = "aac"
+AUDIO_BITRATE = "192k"
+# Encoder workers per subreddit; the shared scheduler caps the ffmpeg threads across all subreddits
+THREADS = scheduler.encoder_slots
+# "ffmpeg" burns the caption in during the re-encode, "moviepy" composites it afterwards in Python
+OVERLAY_MODE = "ffmpeg"
+# Tried in order; Pillow also looks the names up in the system font folders
+CAPTION_FONT_FILES = ("arialbd.ttf", "Arial Bold.ttf", "DejaVuSans-Bold.ttf")
+CAPTION_FONT_SIZE = 36
+CAPTION_STROKE_WIDTH = 2
+CAPTION_PADDING = 10
+CAPTION_BOX_OPACITY = 0.6
+
+@lru_cache(maxsize=None)
+def get_aws_client():
+    """Create the S3 client on first use so importing this module does not pay for boto3."""
+    from src.client.s3_client import S3Client
+    return S3Client()
+
+
+@lru_cache(maxsize=None)
+def get_transcode_cache():
+    return TranscodeCache(TRANSCODE_CACHE_DIR, TRANSCODE_CACHE_MAX_BYTES)
+
+
+@lru_cache(maxsize=None)
+def get_post_index():
+    return PostIndex()
+
+
+@lru_cache(maxsize=None)
+def get_caption_cache():
+    return CaptionCache(CAPTION_CACHE_DIR, CAPTION_CACHE_MAX_BYTES)
+
+
+def get_caption_style():
+    return {
+        "font_files": list(CAPTION_FONT_FILES),
+        "font_size": CAPTION_FONT_SIZE,
+        "stroke_width": CAPTION_STROKE_WIDTH,
+        "padding": CAPTION_PADDING,
+        "box_opacity": CAPTION_BOX_OPACITY,
+    }
+
+
+def render_caption(title, frame_size=None):
+    """Return (path, layout) of the caption image for a title, rendered once and then served from the cache."""
+    frame_size = frame_size or tuple(map(int, ENCODED_RESOLUTION.split("x")))
+    caption_cache = get_caption_cache()
+    with metrics.span("caption"):
+        return caption_cache.render(title, frame_size, get_caption_style())
 
-aws_client = S3Client()
 
 def check_video_format(input_path):
-    """Check if the video format, resolution, and frame rate match the required settings."""
+    """Check if the codecs, resolution, frame rate and audio layout already match what reencode_video produces."""
     print(f"Checking video format for {input_path}...")
-    command = [
-        "ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries",
-        "stream=width,height,r_frame_rate", "-of", "csv=p=0", input_path
-    ]
-    try:
-        output = subprocess.check_output(command, stderr=subprocess.STDOUT).decode("utf-8").strip().split("\n")
-        width, height = map(int, output[0].split(",")[:2])  # Extract width and height
-        frame_rate = round(eval(output[0].split(",")[2]))  # Convert frame rate to integer
-
-        if (width, height) == (1920, 1080) and frame_rate == FRAME_RATE:
-            print(f"✅ {input_path} is already in the correct format.")
-            return True
-        else:
-            print(f"⚠️ {input_path} does not match required format.")
-            return False
-    except Exception as e:
-        print(f"⚠️ Failed to check format for {input_path}: {e}")
+    probe = FFmpegUtil.probe_streams(input_path)
+    if probe is None:
+        print(f"⚠️ Failed to check format for {input_path}")
         return False
 
+    width, height = map(int, ENCODED_RESOLUTION.split("x"))
+    matches = (
+        (probe["width"], probe["height"]) == (width, height)
+        and probe["frame_rate"] == FRAME_RATE
+        and probe["video_codec"] == "h264"
+        and probe["pix_fmt"] == PIXEL_FORMAT
+        and probe["audio_codec"] == AUDIO_CODEC
+        and probe["sample_rate"] == str(AUDIO_SAMPLE_RATE)
+        and probe["channels"] == 2
+    )
+    if matches:
+        print(f"✅ {input_path} is already in the correct format.")
+    else:
+        print(f"⚠️ {input_path} does not match required format.")
+    return matches
+
 
-def reencode_video(input_path, output_path):
-    """Re-encode video to ensure uniform format with black bars if needed."""
+def get_encode_settings(title=None):
+    """Everything that changes the output of reencode_video, used as part of the transcode cache key."""
+    settings = {
+        "resolution": ENCODED_RESOLUTION,
+        "frame_rate": FRAME_RATE,
+        "video_codec": VIDEO_CODEC,
+        "preset": VIDEO_PRESET,
+        "pix_fmt": PIXEL_FORMAT,
+        "audio_codec": AUDIO_CODEC,
+        "audio_bitrate": AUDIO_BITRATE,
+        "sample_rate": AUDIO_SAMPLE_RATE,
+    }
+    if title is not None:
+        settings["caption"] = {"text": title, **get_caption_style()}
+    return settings
+
+
+def build_scale_filter():
+    """Scale to the target resolution, keeping the aspect ratio and padding with black bars."""
+    width, height = ENCODED_RESOLUTION.split("x")
+    return f"scale=w={width}:h={height}:force_original_aspect_ratio=decrease,pad={width}:{height}:(ow-iw)/2:(oh-ih)/2"
+
+
+def reencode_video(input_path, output_path, title=None):
+    """Re-encode video to ensure uniform format with black bars if needed.
+
+    When a title is given, its pre-rendered caption image is overlaid in the same filter graph, so the
+    clip is only encoded once and the caption is blended as a single static layer.
+    """
     print(f"Re-encoding {input_path}...")
+    input_args = ["-i", input_path]
+    audio_args = ["-map", "0:a:0?"]
+
+    # Every segment gets an audio track with the same layout so the final concat can stream-copy
+    probe = FFmpegUtil.probe_streams(input_path)
+    if probe is not None and probe["audio_codec"] is None:
+        input_args += ["-f", "lavfi", "-i", f"anullsrc=r={AUDIO_SAMPLE_RATE}:cl=stereo"]
+        audio_args = ["-map", "1:a:0", "-shortest"]
+
+    if title is None:
+        filter_args = ["-vf", build_scale_filter(), "-map", "0:v:0"]
+    else:
+        caption_path, layout = render_caption(title)
+        caption_input = input_args.count("-i")
+        input_args += ["-i", caption_path]
+        x, y = layout["position"]
+        filter_args = [
+            "-filter_complex", f"[0:v:0]{build_scale_filter()}[scaled];[scaled][{caption_input}:v]overlay=x={x}:y={y}[captioned]",
+            "-map", "[captioned]"
+        ]
+
     command = [
-    "ffmpeg", "-i", input_path,
-    "-c:v", "libx264", "-c:a", "aac", "-b:a", "192k",
-    "-preset", "fast", "-r", str(FRAME_RATE),
-    "-vf", "scale=w=1920:h=1080:force_original_aspect_ratio=decrease,pad=1920:1080:(ow-iw)/2:(oh-ih)/2",
+    "ffmpeg", *input_args, *filter_args, *audio_args,
+    "-c:v", VIDEO_CODEC, "-pix_fmt", PIXEL_FORMAT, "-c:a", AUDIO_CODEC, "-b:a", AUDIO_BITRATE,
+    "-ar", str(AUDIO_SAMPLE_RATE), "-ac", "2",
+    "-preset", VIDEO_PRESET, "-r", str(FRAME_RATE),
+    "-threads", str(scheduler.ffmpeg_threads),
     "-strict", "experimental", output_path, "-y"
 ]
 
     try:
-        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        # The output may be a hard link into the transcode cache, never write through it
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        with scheduler.cpu():
+            FFmpegUtil.run_with_progress(command, stage="encode")
+        metrics.increment("bytes_encoded", os.path.getsize(output_path))
         print(f"✅ {input_path} re-encoded successfully.")
         return output_path
     except Exception as e:
@@ -55,69 +172,208 @@ def reencode_video(input_path, output_path):
         return None
 
 
-def reencode_video_concurrent(input_path, output_folder):
+def reencode_video_concurrent(input_path, output_folder, title=None):
     """Helper function to handle re-encoding in parallel."""
-    # Add check_video_format check to not reencode videos when the resolution matches 
+    # Clips that already match the target format only need an encode when a caption has to be burnt in
+    if title is None and check_video_format(input_path):
+        metrics.increment("clips_passed_through")
+        return input_path
+
     reencoded_path = os.path.join(output_folder, f"reencoded_{os.path.basename(input_path)}")
-    return reencode_video(input_path, reencoded_path)
+    transcode_cache = get_transcode_cache()
+    cache_key = transcode_cache.make_key(input_path, get_encode_settings(title))
+    if transcode_cache.fetch(cache_key, reencoded_path):
+        print(f"♻️ Reusing cached encode for {input_path}")
+        metrics.increment("transcode_cache_hits")
+        return reencoded_path
+
+    if reencode_video(input_path, reencoded_path, title) is None:
+        return None
+    transcode_cache.store(cache_key, reencoded_path)
+    return reencoded_path
+
+
+def clip_sort_key(filename):
+    """Order clips by their download number so the compilation follows the listing order."""
+    stem = os.path.splitext(os.path.basename(filename))[0].replace("reencoded_", "")
+    return (0, int(stem), stem) if stem.isdigit() else (1, 0, stem)
 
 
 def add_text_overlay(video_clip, text):
     """Adds text overlay with a black semi-transparent background."""
+    # moviepy is only needed in moviepy overlay mode and is slow to import
+    from moviepy.editor import ImageClip, CompositeVideoClip
     print("Adding text overlay to video...")
 
-    width, height = video_clip.size
-    position = ("center", height * 0.85)  # Slightly above the bottom for horizontal videos
+    # Text and box come as one cached RGBA image, so no ImageMagick call and a single layer per frame
+    caption_path, layout = render_caption(text, tuple(video_clip.size))
+    caption_clip = ImageClip(caption_path, transparent=True) \
+        .set_duration(video_clip.duration) \
+        .set_position(tuple(layout["position"]))
 
-    # Create text clip
-    txt_clip = TextClip(
-    text,
-    fontsize=36,
-    color='white',
-    font="Arial-Bold",
-    stroke_color="black",
-    stroke_width=2,
-    method="caption",
-    size=(width * 0.9, None)  # Set the width of the text to 90% of video width, height is auto
-).set_duration(video_clip.duration)
+    return CompositeVideoClip([video_clip, caption_clip])
 
-    # Create a black background rectangle slightly larger than the text
-    padding = 10  # Padding around text
-    bg_width, bg_height = txt_clip.size[0] + 2 * padding, txt_clip.size[1] + 2 * padding
 
-    bg_clip = ColorClip(size=(bg_width, bg_height), color=(0, 0, 0)) \
-        .set_opacity(0.6) \
-        .set_duration(video_clip.duration)
+def render_overlay_segment(video_path, title, segment_path):
+    """Composite the caption with moviepy and write the clip as its own segment, closing the readers afterwards."""
+    from moviepy.editor import VideoFileClip
+    clip = VideoFileClip(video_path)
+    try:
+        overlaid = add_text_overlay(clip, title)
+        # One extra unit for the Python thread that composites the frames
+        with scheduler.cpu(scheduler.ffmpeg_threads + 1), metrics.span("composite"):
+            overlaid.write_videofile(
+                segment_path, codec="libx264", audio_codec="aac", preset="ultrafast",
+                fps=FRAME_RATE, audio_fps=AUDIO_SAMPLE_RATE, threads=scheduler.ffmpeg_threads, logger=None
+            )
+        overlaid.close()
+        return segment_path
+    except Exception as e:
+        print(f"❌ Error processing {video_path}: {e}")
+        return None
+    finally:
+        clip.close()
+
 
-    # Position both the background and text
-    txt_clip = txt_clip.set_position(position)
-    bg_clip = bg_clip.set_position(position)
+def concat_segments(segment_paths, output_path, stream_to_s3=False):
+    """
+    Join the per-clip segments into the final video.
 
-    return CompositeVideoClip([video_clip, bg_clip, txt_clip])
+    The concat demuxer copies the streams when every segment shares codec, resolution, frame rate and
+    audio layout, so memory and open files stay constant regardless of the clip count. Segments that
+    differ from the first one are re-encoded to the common format before joining.
+
+    With stream_to_s3, the joined video is never written: ffmpeg muxes a fragmented MP4 into a pipe that
+    feeds the S3 multipart upload, and the S3 URI of the object is returned instead of output_path.
+    """
+    reference = FFmpegUtil.probe_streams(segment_paths[0])
+    if reference is None:
+        print(f"⚠️ Could not probe {segment_paths[0]}, skipping it.")
+        return concat_segments(segment_paths[1:], output_path, stream_to_s3) if len(segment_paths) > 1 else None
+
+    joinable = []
+    for path in segment_paths:
+        if FFmpegUtil.probe_streams(path) == reference:
+            joinable.append(path)
+            continue
+
+        print(f"⚠️ {path} does not match the other segments, re-encoding it before the join.")
+        normalized_path = os.path.join(os.path.dirname(output_path), f"normalized_{os.path.basename(path)}")
+        if reencode_video(path, normalized_path) and FFmpegUtil.probe_streams(normalized_path) == reference:
+            joinable.append(normalized_path)
+        else:
+            print(f"❌ Dropping {path}, it could not be converted to the common format.")
+            metrics.increment("clips_skipped", reason="incompatible_segment")
+
+    if stream_to_s3:
+        joined = FFmpegUtil.concat_stream(joinable, f"{output_path}.txt", lambda stream: get_aws_client().upload_stream(stream, output_path))
+    else:
+        joined = FFmpegUtil.concat_copy(joinable, output_path)
+
+    for path in joinable:
+        if os.path.basename(path).startswith("normalized_"):
+            scratch.consume(path)
+    return joined
+
+
+def encode_clip(folder_path, filename, title):
+    """Re-encode one downloaded clip, burning in its caption when OVERLAY_MODE is "ffmpeg"."""
+    # An interrupted run may have encoded the clip already
+    checkpoint = CheckpointUtil.get_clips(folder_path).get(filename, {})
+    if checkpoint.get("stage") == CheckpointUtil.ENCODED and os.path.exists(checkpoint["encoded_path"]):
+        return checkpoint["encoded_path"]
+
+    # In ffmpeg mode the caption is burnt in during the re-encode, so Python never touches the pixels
+    caption = title if OVERLAY_MODE == "ffmpeg" else None
+    input_path = os.path.join(folder_path, filename)
+    encoded_path = reencode_video_concurrent(input_path, folder_path, caption)
+    if not encoded_path:
+        # No encode will ever release the download, so it must not hold back the next ones
+        scratch.track(input_path)
+        return None
+
+    CheckpointUtil.update_clip(folder_path, filename, stage=CheckpointUtil.ENCODED, encoded_path=encoded_path)
+    # Waits for the concat now, which no longer holds back the downloads
+    scratch.track(encoded_path)
+    # The download is of no use once encoded, unless the clip passed through as is
+    if encoded_path != input_path and scratch.consume(input_path):
+        get_post_index().release_file(input_path)
+    return encoded_path
+
+
+def assemble_compilation(folder_path, reencoded_videos, metadata, upload=True):
+    """
+    Join the re-encoded clips (in order) into result/result.mp4 and upload it, unless upload is False.
+
+    The compilation always goes under output/, even when the clips are in a tmpfs scratch space. With
+    STREAM_RESULT_TO_S3 it goes straight to S3 instead, and its S3 URI is returned.
+    """
+    result_folder = os.path.join(scratch.persistent_path(folder_path), "result")
+    os.makedirs(result_folder, exist_ok=True)
+
+    segments = reencoded_videos
+    if OVERLAY_MODE != "ffmpeg":
+        segments = []
+        # A folder of its own, so segments are never taken for downloaded clips
+        segment_folder = os.path.join(folder_path, "segments")
+        os.makedirs(segment_folder, exist_ok=True)
+        for video_path in reencoded_videos:
+            filename = os.path.basename(video_path).replace("reencoded_", "")
+            title = metadata.get(filename, "Unknown Title")  # Retrieve original Reddit title
+            segment_path = render_overlay_segment(video_path, title, os.path.join(segment_folder, f"segment_{filename}"))
+            if segment_path:
+                scratch.track(segment_path)
+                scratch.consume(video_path)
+                segments.append(segment_path)
+
+    if not segments:
+        print("⚠️ No valid video clips to merge.")
+        return None
+
+    stream_to_s3 = upload and STREAM_RESULT_TO_S3
+    with metrics.span("assemble"):
+        output_path = concat_segments(segments, os.path.join(result_folder, "result.mp4"), stream_to_s3)
+    if output_path is None:
+        print("⚠️ Failed to join the video clips.")
+        return None
+
+    for segment_path in segments:
+        scratch.consume(segment_path)
+
+    if upload and not stream_to_s3:
+        # Runs in the background so the next subreddit does not wait on the upload
+        get_aws_client().upload_to_s3_async(output_path)
+
+    print(f"✅ Videos stitched successfully! Output: {output_path}")
+    return output_path
 
 
 def stitch_videos_in_folder(folder_path):
     """Stitches all videos in the folder into a single output video with text overlays."""
     print(f"Stitching videos from folder: {folder_path}...")
-    video_files = [f for f in os.listdir(folder_path) if f.lower().endswith(('.mp4'))]
+    # Clips encoded before an interrupted merge may only be left as their encode
+    encoded_clips = {
+        filename for filename, clip in CheckpointUtil.get_clips(folder_path).items()
+        if clip.get("stage") == CheckpointUtil.ENCODED and os.path.exists(clip["encoded_path"])
+    }
+    video_files = sorted(
+        {f for f in os.listdir(folder_path) if f.lower().endswith(('.mp4')) and not f.startswith("reencoded_")} | encoded_clips,
+        key=clip_sort_key
+    )
     if not video_files:
         print("⚠️ No video files found.")
         return None
 
-    result_folder = os.path.join(folder_path, "result")
-    os.makedirs(result_folder, exist_ok=True)
-
-    metadata_path = os.path.join(folder_path, "metadata.json")
-    metadata = {}
-    if os.path.exists(metadata_path):
-        with open(metadata_path, "r") as f:
-            metadata = json.load(f)
+    metadata = MetadataStore.for_folder(folder_path)
 
     reencoded_videos = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=THREADS) as executor:
-        futures = {executor.submit(reencode_video_concurrent, os.path.join(folder_path, file), folder_path): file for file in video_files}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=THREADS) as executor, metrics.span("encode_all"):
+        futures = [
+            executor.submit(encode_clip, folder_path, file, metadata.get(file, "Unknown Title"))
+            for file in video_files
+        ]
 
-        for future in concurrent.futures.as_completed(futures):
+        for future in futures:
             reencoded_path = future.result()
             if reencoded_path:
                 reencoded_videos.append(reencoded_path)
@@ -126,26 +382,4 @@ def stitch_videos_in_folder(folder_path):
         print("⚠️ No valid videos to merge.")
         return None
 
-    clips = []
-    for video_path in reencoded_videos:
-        try:
-            clip = VideoFileClip(video_path)
-            filename = os.path.basename(video_path).replace("reencoded_", "")
-            title = metadata.get(filename, "Unknown Title")  # Retrieve original Reddit title
-            clip = add_text_overlay(clip, title)  # Add overlay
-            clips.append(clip)
-        except Exception as e:
-            print(f"❌ Error processing {video_path}: {e}")
-
-    if clips:
-        final_video = concatenate_videoclips(clips, method="chain")
-        output_path = os.path.join(result_folder, "result.mp4")
-        final_video.write_videofile(output_path, codec="libx264", audio_codec="aac", preset="ultrafast", threads=4)
-        
-        aws_client.upload_to_s3(output_path)
-        
-        print(f"✅ Videos stitched successfully! Output: {output_path}")
-        return output_path
-    else:
-        print("⚠️ No valid video clips to merge.")
-        return None
+    return assemble_compilation(folder_path, reencoded_videos, metadata)
@@ -0,0 +1,60 @@
+import queue
+import threading
+from src.constants.constants import PIPELINE_QUEUE_SIZE
+from src.handler.download_handler import fetch_top_videos
+from src.handler.merge_handler import THREADS, assemble_compilation, clip_sort_key, encode_clip
+
+def run_streaming_pipeline(subreddit_name, duration_in_seconds, download_folder=None):
+    """
+    Download and encode a subreddit's clips at the same time.
+
+    Each clip is handed to the encoder pool as soon as its download is committed. The queue between
+    the stages is bounded, so downloads pause when the encoders fall behind. The final assembly starts
+    once the duration budget is met and the last encode finishes. A download folder left by an interrupted
+    run is continued, and its clips that were already encoded are not encoded again.
+
+    :return: Tuple of (download folder, path of the stitched video or None)
+    """
+    clip_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    metadata = {}
+    encoded_videos = {}
+    encoded_lock = threading.Lock()
+
+    def encoder():
+        while True:
+            item = clip_queue.get()
+            if item is None:
+                return
+            folder, filename, title = item
+            try:
+                reencoded_path = encode_clip(folder, filename, title)
+            except Exception as e:
+                print(f"❌ Error encoding {filename}: {e}")
+                continue
+            if reencoded_path:
+                with encoded_lock:
+                    encoded_videos[filename] = reencoded_path
+
+    def on_clip_ready(folder, filename, title):
+        metadata[filename] = title
+        # Blocks while the queue is full, which holds back the next download
+        clip_queue.put((folder, filename, title))
+
+    workers = [threading.Thread(target=encoder, daemon=True) for _ in range(THREADS)]
+    for worker in workers:
+        worker.start()
+
+    try:
+        download_folder = fetch_top_videos(subreddit_name, duration_in_seconds, on_clip_ready, download_folder)
+    finally:
+        for _ in workers:
+            clip_queue.put(None)
+        for worker in workers:
+            worker.join()
+
+    reencoded_videos = [encoded_videos[filename] for filename in sorted(encoded_videos, key=clip_sort_key)]
+    if not reencoded_videos:
+        print("⚠️ No valid videos to merge.")
+        return download_folder, None
+
+    return download_folder, assemble_compilation(download_folder, reencoded_videos, metadata)
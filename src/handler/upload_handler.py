@@ -1,16 +1,68 @@
+import http.client
 import json
+import random
+import sys
+import time
+from functools import lru_cache
+import httplib2
+import requests
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
 from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload
 import os
 
+from src.constants.constants import (
+    YOUTUBE_API_ENDPOINT, YOUTUBE_DISCOVERY_MAX_AGE_SECONDS, YOUTUBE_DISCOVERY_PATH, YOUTUBE_DISCOVERY_URL,
+    YOUTUBE_INSERT_QUOTA_COST, YOUTUBE_TOKEN_PATH, YOUTUBE_UPLOAD_CHUNK_SIZE, YOUTUBE_UPLOAD_MAX_RETRIES
+)
+from src.util.file_util import FileUtil
+from src.util.metrics_util import metrics
 from src.util.upload_scheduler_util import UploadSchedulerUtil
+from src.util.upload_state_util import UploadStateUtil
 
 # OAuth 2.0 Scopes
 SCOPES = ['https://www.googleapis.com/auth/youtube.upload']
 
-def authenticate_youtube():
-    """Authenticate the user and build the YouTube API client."""
+# The token holds the OAuth refresh token, so only its owner may read it
+TOKEN_FILE_MODE = 0o600
+
+# Errors worth retrying a chunk for, everything else fails the upload
+RETRIABLE_STATUS_CODES = (500, 502, 503, 504)
+# Dropped and timed-out connections, after Google's resumable upload sample. The sample's IOError (OSError)
+# is left out, so errors like a missing or unreadable file fail at once instead of retrying
+RETRIABLE_EXCEPTIONS = (httplib2.HttpLib2Error, http.client.HTTPException, ConnectionError, TimeoutError)
+
+def get_credentials(token_path=YOUTUBE_TOKEN_PATH):
+    """
+    Return the user's credentials, refreshing the cached token when it has expired.
+
+    The browser-based OAuth flow only runs when there is no usable token, and only from an interactive
+    terminal, so unattended runs from cron fail fast instead of waiting on a browser.
+    """
+    credentials = None
+    if os.path.exists(token_path):
+        # Tokens cached before they were written owner-only may still be readable by others
+        os.chmod(token_path, TOKEN_FILE_MODE)
+        credentials = Credentials.from_authorized_user_file(token_path, SCOPES)
+
+    if credentials and credentials.valid:
+        return credentials
+
+    if credentials and credentials.expired and credentials.refresh_token:
+        try:
+            credentials.refresh(Request())
+            FileUtil.write_atomically(token_path, credentials.to_json(), mode=TOKEN_FILE_MODE)
+            return credentials
+        except RefreshError as e:
+            print(f"⚠️ Failed to refresh the cached YouTube token: {e}")
+
+    if not sys.stdin.isatty():
+        raise RuntimeError(f"No valid YouTube token at {token_path}. Authorize once from an interactive terminal.")
+
     print("Current working directory:", os.getcwd())
 
     # Use a fixed port (8080) to avoid dynamic redirect URI
@@ -18,21 +70,166 @@ def authenticate_youtube():
     
     # Here, we are fixing the redirect URI with a specific port (8080)
     credentials = flow.run_local_server(port=8080)  # Use port 8080 for fixed redirect URI
-    
-    youtube = build('youtube', 'v3', credentials=credentials)
-    return youtube
+    FileUtil.write_atomically(token_path, credentials.to_json(), mode=TOKEN_FILE_MODE)
+    return credentials
+
+def is_valid_discovery_document(document):
+    return document.get("name") == "youtube" and document.get("version") == "v3" and "resources" in document
+
+@lru_cache(maxsize=None)
+def load_discovery_document(path=YOUTUBE_DISCOVERY_PATH):
+    """
+    Return the YouTube v3 discovery document from the local cache, as a JSON string.
+
+    The cache is refreshed from the network once it is older than YOUTUBE_DISCOVERY_MAX_AGE_SECONDS, and
+    only replaced by a document with a newer revision. When the refresh fails, the cached copy is used.
+    """
+    cached = None
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            cached = json.load(f)
+        if not is_valid_discovery_document(cached):
+            print(f"⚠️ Ignoring invalid discovery document at {path}")
+            cached = None
+        elif time.time() - os.path.getmtime(path) < YOUTUBE_DISCOVERY_MAX_AGE_SECONDS:
+            return json.dumps(cached)
+
+    try:
+        response = requests.get(YOUTUBE_DISCOVERY_URL, timeout=10)
+        response.raise_for_status()
+        fetched = response.json()
+        if not is_valid_discovery_document(fetched):
+            raise ValueError("unexpected discovery document")
+    except Exception as e:
+        if cached is None:
+            # google-api-python-client ships a copy of the document matching its own version
+            from googleapiclient.discovery_cache import get_static_doc
+            bundled = get_static_doc("youtube", "v3")
+            if bundled is None:
+                raise
+            print(f"⚠️ Could not fetch the YouTube discovery document, using the bundled copy: {e}")
+            return bundled
+        print(f"⚠️ Could not refresh the YouTube discovery document, using the cached copy: {e}")
+        return json.dumps(cached)
+
+    if cached is None or fetched.get("revision", "") >= cached.get("revision", ""):
+        FileUtil.write_json_atomically(path, fetched)
+        return json.dumps(fetched)
+
+    # Keep the newer cached revision but mark it as checked
+    os.utime(path)
+    return json.dumps(cached)
+
+def build_youtube(credentials):
+    """Build a YouTube API client. Clients are not thread safe, so build one per upload thread."""
+    client_options = None
+    if os.getenv(YOUTUBE_API_ENDPOINT):
+        client_options = {"api_endpoint": os.getenv(YOUTUBE_API_ENDPOINT)}
+    return build_from_document(load_discovery_document(), credentials=credentials, client_options=client_options)
+
+def authenticate_youtube():
+    """Authenticate the user and build the YouTube API client."""
+    return build_youtube(get_credentials())
 
 def upload_video_from_s3(youtube, bucket, subreddit_details):
     pass
 
+def query_upload_status(request, file_path):
+    """
+    Ask the server how much of a resumable upload it has, with an empty PUT carrying "Content-Range: bytes */<size>".
+
+    :return: (bytes received, response). The response is the uploaded video when the server already has
+        the whole file. Bytes received is None when the session expired.
+    """
+    size = os.path.getsize(file_path)
+    resp, content = request.http.request(
+        request.resumable_uri, method="PUT", headers={"Content-Range": f"bytes */{size}", "Content-Length": "0"}
+    )
+    if resp.status in (200, 201):
+        return size, request.postproc(resp, content)
+    if resp.status == 308:
+        # "bytes=0-<last byte received>", or no header at all when nothing was received yet
+        received = resp.get("range")
+        return (int(received.rsplit("-", 1)[1]) + 1 if received else 0), None
+    if resp.status in (404, 410):
+        return None, None
+    raise HttpError(resp, content, uri=request.resumable_uri)
+
+def execute_resumable(request, file_path):
+    """
+    Send a resumable upload chunk by chunk, persisting the session after every acknowledged chunk.
+
+    A session saved by an interrupted run is picked up again, so the upload continues from the last
+    byte the server acknowledged instead of starting over. When that session expired, the upload starts
+    over as a new insert, which is charged again.
+
+    :return: The uploaded video, or None when an expired session has to start over and today's quota
+        cannot pay for it
+    """
+    session = UploadStateUtil.get_session(file_path)
+    resumed_from = 0
+    response = None
+    if session:
+        request.resumable_uri = session["resumable_uri"]
+        # The server may have received more than the last chunk saved, so it is asked rather than trusted
+        received, response = query_upload_status(request, file_path)
+        if received is None:
+            print(f"⚠️ The upload session of {file_path} expired, starting over")
+            UploadStateUtil.clear_session(file_path)
+            request.resumable_uri = None
+            # upload_video did not reserve quota for a resumed session, but a new insert costs the full price
+            if not UploadStateUtil.reserve_quota(YOUTUBE_INSERT_QUOTA_COST):
+                return None
+        else:
+            resumed_from = received
+            request.resumable_progress = received
+            print(f"↩️ Resuming upload of {file_path} from byte {received}")
+
+    retries = 0
+    while response is None:
+        try:
+            status, response = request.next_chunk()
+            retries = 0
+            if status:
+                UploadStateUtil.save_session(file_path, request.resumable_uri, status.resumable_progress)
+                print(f"⬆️ {file_path}: {int(status.progress() * 100)}%")
+        except HttpError as e:
+            if e.resp.status not in RETRIABLE_STATUS_CODES or retries >= YOUTUBE_UPLOAD_MAX_RETRIES:
+                raise
+            retries += 1
+        except RETRIABLE_EXCEPTIONS:
+            if retries >= YOUTUBE_UPLOAD_MAX_RETRIES:
+                raise
+            retries += 1
+        else:
+            continue
+
+        metrics.increment("upload_retries", target="youtube")
+        if request.resumable_uri:
+            UploadStateUtil.save_session(file_path, request.resumable_uri, request.resumable_progress)
+        # Exponential backoff with jitter before retrying the chunk
+        time.sleep(min(64, 2 ** retries) * random.uniform(0.5, 1))
+
+    UploadStateUtil.clear_session(file_path)
+    metrics.increment("bytes_uploaded", os.path.getsize(file_path) - resumed_from, target="youtube")
+    return response
+
 def upload_video(youtube, file_path, subreddit_details):
     """Upload a video to YouTube."""
     print(f"👀 Attempting to upload video at {file_path} to YouTube")
     title, description, category, privacy, episode, duration_in_seconds, upload_date = subreddit_details.values()
     title = f"{title}{episode}"
+    quota_reserved = False
     try:
         category_id = str(category)  # Ensure category is a string of a valid YouTube category ID
-        
+
+        # A resumed session was already paid for when it was started
+        if UploadStateUtil.get_session(file_path) is None:
+            if not UploadStateUtil.reserve_quota(YOUTUBE_INSERT_QUOTA_COST):
+                print(f"⏸️ Not enough YouTube quota left today to upload {file_path}")
+                return None
+            quota_reserved = True
+
         # Call the API's videos.insert method to upload the video
         request = youtube.videos().insert(
             part="snippet,status",
@@ -48,9 +245,13 @@ def upload_video(youtube, file_path, subreddit_details):
                     "madeForKids": False
                 }
             },
-            media_body=file_path
+            media_body=MediaFileUpload(file_path, chunksize=YOUTUBE_UPLOAD_CHUNK_SIZE, resumable=True)
         )
-        response = request.execute()
+        with metrics.span("youtube_upload"):
+            response = execute_resumable(request, file_path)
+        if response is None:
+            print(f"⏸️ Not enough YouTube quota left today to upload {file_path} again")
+            return None
 
         print(f"Video '{title}' was successfully uploaded.")
         print(f"Video URL: https://www.youtube.com/watch?v={response['id']}")
@@ -60,8 +261,10 @@ def upload_video(youtube, file_path, subreddit_details):
         print(f"An error occurred: {e}")
         return None
     except FileNotFoundError:
+        if quota_reserved:
+            UploadStateUtil.refund_quota(YOUTUBE_INSERT_QUOTA_COST)
         print(f"File not found: {file_path}")
         return None
     except Exception as e:
         print(f"Unexpected error: {e}")
-        return None
\ No newline at end of file
+        return None
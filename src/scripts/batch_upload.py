@@ -1,10 +1,15 @@
 import json
 import sys
+import threading
 from concurrent.futures import ThreadPoolExecutor
 
-from ..handler.upload_handler import authenticate_youtube
+from ..handler.upload_handler import build_youtube, get_credentials
+from src.util.checkpoint_util import CheckpointUtil
 from src.util.upload_scheduler_util import UploadSchedulerUtil
-from ..constants.constants import BATCH_UPLOAD_PATH, OUTPUT_PATH_KEY, UPLOAD_DETAILS_KEY
+from src.util.upload_state_util import UploadStateUtil
+from ..constants.constants import (
+    BATCH_UPLOAD_PATH, OUTPUT_PATH_KEY, UPLOAD_DETAILS_KEY, YOUTUBE_INSERT_QUOTA_COST, YOUTUBE_MAX_PARALLEL_UPLOADS
+)
 from src.controller.upload_controller import upload_controller
 
 
@@ -25,15 +30,55 @@ def load_batch_from_json(filename=BATCH_UPLOAD_PATH):
     It will look for a json file at output/batch_upload.json
     Using that config, it will upload each video concurrently
     """
-if __name__ == "__main__":
-    batch_upload = load_batch_from_json()
+
+
+def plan_uploads(batch_upload):
+    """
+    Split the batch into the uploads that fit in today's quota and the ones left for another day.
+
+    Uploads with a saved session were already paid for, so they always run and come first. Videos a
+    previous attempt already uploaded are left out.
+    """
+    batch_upload = [item for item in batch_upload if not CheckpointUtil.is_uploaded(item[OUTPUT_PATH_KEY])]
+    resumed = [item for item in batch_upload if UploadStateUtil.get_session(item[OUTPUT_PATH_KEY])]
+    fresh = [item for item in batch_upload if not UploadStateUtil.get_session(item[OUTPUT_PATH_KEY])]
+    affordable = UploadStateUtil.remaining_quota() // YOUTUBE_INSERT_QUOTA_COST
+    return resumed + fresh[:affordable], fresh[affordable:]
+
+
+def upload_batch(batch_upload, credentials, max_workers=YOUTUBE_MAX_PARALLEL_UPLOADS):
+    """Upload the batch in parallel, one YouTube client per worker thread. Returns the video URLs in batch order."""
+    local = threading.local()
+
+    def upload(item):
+        if not hasattr(local, "youtube"):
+            local.youtube = build_youtube(credentials)
+        video_url = upload_controller(item[OUTPUT_PATH_KEY], item[UPLOAD_DETAILS_KEY], local.youtube)
+        if video_url:
+            CheckpointUtil.mark_uploaded(item[OUTPUT_PATH_KEY], video_url)
+        return video_url
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        return list(executor.map(upload, batch_upload))
+
+def run_batch_upload(filename=BATCH_UPLOAD_PATH):
+    """Upload every video of the batch file that fits in today's quota."""
+    batch_upload = load_batch_from_json(filename)
 
     if not batch_upload:
         print("No videos to upload.")
-        sys.exit(0)
+        return []
+
+    uploads, deferred = plan_uploads(batch_upload)
+    for item in deferred:
+        print(f"⏸️ Deferring {item[OUTPUT_PATH_KEY]}: not enough YouTube quota left today")
 
-    youtube_credentials = authenticate_youtube() 
+    if not uploads:
+        return []
 
-    for item in batch_upload:
-        upload_controller(item[OUTPUT_PATH_KEY], item[UPLOAD_DETAILS_KEY], youtube_credentials)
-            
\ No newline at end of file
+    youtube_credentials = get_credentials()
+
+    return upload_batch(uploads, youtube_credentials, min(YOUTUBE_MAX_PARALLEL_UPLOADS, len(uploads)))
+
+if __name__ == "__main__":
+    run_batch_upload()
@@ -0,0 +1,216 @@
+"""
+End-to-end benchmark of the pipeline on synthetic clips, with every external service replaced by a local fake.
+
+Call this script like `python3 -m src.scripts.benchmark [--save-baseline] [--baseline PATH] [--tolerance 0.2]`
+
+It renders clips with ffmpeg's lavfi sources, then drives fetch_top_videos, stitch_videos_in_folder,
+S3Client.upload_to_s3 and upload_video against the fakes in src/benchmark/fakes.py. It reports wall time,
+CPU seconds (including ffmpeg child processes), peak RSS and bytes moved for each stage. Results are
+compared with a saved baseline, and the exit code is 1 when a stage got slower than the tolerance allows.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from src.benchmark.fakes import FakeReddit, FakeYouTubeUploadServer, make_submissions, mock_s3, serve_folder
+from src.benchmark.synthetic import DEFAULT_CLIP_SPECS, generate_clips
+
+DEFAULT_BASELINE_PATH = "benchmark_baseline.json"
+# Metrics compared against the baseline; the others are reported only
+COMPARED_METRICS = ("wall_seconds", "cpu_seconds")
+
+
+@contextmanager
+def measure(results, stage):
+    """Record wall time, CPU time, peak RSS and bytes moved for the code in the block."""
+    metrics = {"bytes": 0}
+    self_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    yield metrics
+    wall_seconds = time.perf_counter() - start
+    self_after = resource.getrusage(resource.RUSAGE_SELF)
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    cpu_seconds = (
+        (self_after.ru_utime + self_after.ru_stime) - (self_before.ru_utime + self_before.ru_stime)
+        + (children_after.ru_utime + children_after.ru_stime) - (children_before.ru_utime + children_before.ru_stime)
+    )
+    # ru_maxrss is in kilobytes on Linux; it is a high-water mark, so this is the peak up to this stage
+    results[stage] = {
+        "wall_seconds": round(wall_seconds, 3),
+        "cpu_seconds": round(cpu_seconds, 3),
+        "peak_rss_mb": round(self_after.ru_maxrss / 1024, 1),
+        "peak_child_rss_mb": round(children_after.ru_maxrss / 1024, 1),
+        "bytes": metrics["bytes"],
+    }
+    print(f"⏱️ {stage}: {results[stage]}")
+
+
+def folder_size(folder, predicate=lambda name: True):
+    return sum(
+        os.path.getsize(os.path.join(folder, name))
+        for name in os.listdir(folder)
+        if predicate(name) and os.path.isfile(os.path.join(folder, name))
+    )
+
+
+def run_benchmark(workspace, clip_specs=None):
+    """
+    Run every stage inside the workspace folder and return the per-stage metrics.
+
+    Reusing a workspace keeps the rendered clips and the transcode cache, which measures a warm rerun.
+    """
+    from src.client.reddit_client import RedditWrapper
+    from src.client.s3_client import S3Client
+    from src.handler.merge_handler import stitch_videos_in_folder
+    from src.handler.upload_handler import upload_video
+    from src.util.frame_hash_index import FrameHashIndex
+    from src.util.metrics_util import metrics as pipeline_metrics
+    from src.util.post_index import PostIndex
+    from src.util.rate_limiter import TokenBucket
+
+    # The pipeline writes relative to the working directory (output/, post index, caches)
+    os.chdir(workspace)
+    clips = generate_clips(os.path.join(workspace, "clips"), clip_specs or DEFAULT_CLIP_SPECS)
+    duration_budget = sum(spec[3] for _, spec in clips)
+    results = {}
+
+    with serve_folder(os.path.join(workspace, "clips")) as base_url:
+        # Skip __init__: the fake listing needs no credentials
+        wrapper = RedditWrapper.__new__(RedditWrapper)
+        wrapper.reddit = FakeReddit(make_submissions(clips, base_url))
+        # A fresh index every run, otherwise the clips would count as already used or downloaded
+        index_path = os.path.join(workspace, "post_index.db")
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        wrapper.post_index = PostIndex(index_path)
+        hash_index_path = os.path.join(workspace, "frame_hashes.db")
+        if os.path.exists(hash_index_path):
+            os.remove(hash_index_path)
+        wrapper.frame_index = FrameHashIndex(hash_index_path)
+        # Nor should clips of an earlier run in the same second count as already downloaded or encoded
+        from src.constants.constants import CHECKPOINT_PATH, CLIP_CHECKPOINT_PATH
+        for checkpoint_path in (CHECKPOINT_PATH, CLIP_CHECKPOINT_PATH):
+            if os.path.exists(checkpoint_path):
+                os.remove(checkpoint_path)
+        # The local server has no API budget to respect
+        wrapper.rate_limiter = TokenBucket(1000, 1000)
+
+        with measure(results, "fetch") as metrics:
+            download_folder = wrapper.fetch_top_videos("benchmark", duration_budget)
+            metrics["bytes"] = folder_size(download_folder, lambda name: name.endswith(".mp4"))
+
+    with mock_s3("rscraped"):
+        S3Client._shared_client = None
+
+        with measure(results, "stitch") as metrics:
+            # The per-clip encodes are deleted once joined, so they are counted as they are written
+            encoded_before = pipeline_metrics.counter("bytes_encoded")
+            output_path = stitch_videos_in_folder(download_folder)
+            S3Client.wait_for_uploads()
+            if output_path is None:
+                raise RuntimeError("Stitching produced no output")
+            metrics["bytes"] = pipeline_metrics.counter("bytes_encoded") - encoded_before
+            metrics["bytes"] += os.path.getsize(output_path)
+
+        # Upload a copy under a new key, so the unchanged-object check does not skip it
+        upload_path = os.path.join("output", "benchmark", "upload", "result.mp4")
+        os.makedirs(os.path.dirname(upload_path), exist_ok=True)
+        shutil.copyfile(output_path, upload_path)
+        with measure(results, "s3_upload") as metrics:
+            if not S3Client().upload_to_s3(upload_path):
+                raise RuntimeError("S3 upload failed")
+            metrics["bytes"] = os.path.getsize(upload_path)
+
+    # Start from a clean upload state so neither old sessions nor spent quota carry over between runs
+    from src.constants.constants import UPLOAD_STATE_PATH
+    if os.path.exists(UPLOAD_STATE_PATH):
+        os.remove(UPLOAD_STATE_PATH)
+
+    with FakeYouTubeUploadServer() as fake_youtube:
+        youtube = build_fake_youtube(fake_youtube.url)
+        upload_details = {
+            "title": "Benchmark #", "description": "Synthetic benchmark upload", "category": "23",
+            "privacy": "private", "episode": 1, "duration_in_seconds": duration_budget, "publish_day": "Monday",
+        }
+        with measure(results, "youtube_upload") as metrics:
+            if upload_video(youtube, output_path, upload_details) is None:
+                raise RuntimeError("YouTube upload failed")
+            metrics["bytes"] = fake_youtube.bytes_received
+
+    return results
+
+
+def build_fake_youtube(base_url):
+    """Build a YouTube client from the bundled discovery document, pointed at the fake upload server."""
+    from google.oauth2.credentials import Credentials
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.discovery_cache import get_static_doc
+
+    document = json.loads(get_static_doc("youtube", "v3"))
+    document["rootUrl"] = f"{base_url}/"
+    document["baseUrl"] = f"{base_url}/{document['servicePath']}"
+    return build_from_document(document, credentials=Credentials(token="benchmark"))
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Return a list of regressions: metrics that grew by more than the tolerance."""
+    regressions = []
+    for stage, metrics in results.items():
+        for metric in COMPARED_METRICS:
+            previous = baseline.get(stage, {}).get(metric)
+            if previous and metrics[metric] > previous * (1 + tolerance):
+                regressions.append(f"{stage}.{metric}: {previous} -> {metrics[metric]}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline against local fakes.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="Baseline file to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before failing (0.2 = 20%%)")
+    parser.add_argument("--workspace", help="Folder to run in (defaults to a temporary folder)")
+    parser.add_argument("--report", help="Write the results of this run to a JSON file")
+    args = parser.parse_args(argv)
+
+    baseline_path = os.path.abspath(args.baseline)
+    report_path = os.path.abspath(args.report) if args.report else None
+    workspace = os.path.abspath(args.workspace) if args.workspace else tempfile.mkdtemp(prefix="reddit_benchmark_")
+    os.makedirs(workspace, exist_ok=True)
+    original_cwd = os.getcwd()
+    try:
+        results = run_benchmark(workspace)
+    finally:
+        os.chdir(original_cwd)
+
+    print(json.dumps(results, indent=4))
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump(results, f, indent=4)
+
+    if args.save_baseline:
+        with open(baseline_path, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"📌 Baseline saved to {baseline_path}")
+        return 0
+
+    if not os.path.exists(baseline_path):
+        print(f"No baseline at {baseline_path}, run with --save-baseline to create one.")
+        return 0
+
+    with open(baseline_path, "r") as f:
+        regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+    for regression in regressions:
+        print(f"❌ Regression in {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+from PIL.PngImagePlugin import PngInfo
+from src.util.file_util import FileUtil
+
+class CaptionCache:
+    """
+    On-disk cache of rendered captions: the wrapped title and its semi-transparent box as one RGBA PNG.
+
+    Entries are keyed by (text, frame size, style), so a title is rendered once and every clip, rerun or
+    overlay mode that shows it again reuses the image. The glyph layout (line breaks, line positions,
+    where the image goes on the frame) is stored in the PNG itself, so a hit never loads the font.
+    Entries are evicted least-recently-used first once the cache grows past max_bytes, using the file
+    modification time as the last-used timestamp like the transcode cache.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(text, frame_size, style):
+        """Build the cache key from the caption text, the frame size and the style (a JSON-serializable dict)."""
+        return hashlib.sha256(json.dumps([text, list(frame_size), style], sort_keys=True).encode()).hexdigest()
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def load_font(font_files, font_size):
+        """Load the first font file found, falling back to Pillow's built-in font."""
+        for font_file in font_files:
+            try:
+                return ImageFont.truetype(font_file, font_size)
+            except OSError:
+                continue
+        print(f"⚠️ None of the caption fonts {', '.join(font_files)} is installed, using the default font")
+        return ImageFont.load_default(font_size)
+
+    @staticmethod
+    def wrap(text, font, max_width):
+        """Greedy word wrap measured in pixels, so lines fill the width whatever the glyph widths are."""
+        lines = []
+        for paragraph in text.splitlines() or [""]:
+            line = ""
+            for word in paragraph.split():
+                candidate = f"{line} {word}" if line else word
+                if line and font.getlength(candidate) > max_width:
+                    lines.append(line)
+                    line = word
+                else:
+                    line = candidate
+            lines.append(line)
+        return lines
+
+    @staticmethod
+    def layout(text, frame_size, style):
+        """
+        Place every line of the caption and the caption on the frame.
+
+        The text spans at most 90% of the frame width and the box starts 85% down the frame, like the
+        drawtext and moviepy captions did.
+
+        :return: Dict with the image size, its position on the frame and each line's text and offset
+        """
+        frame_width, frame_height = frame_size
+        font = CaptionCache.load_font(tuple(style["font_files"]), style["font_size"])
+        padding, stroke = style["padding"], style["stroke_width"]
+
+        lines = CaptionCache.wrap(text, font, frame_width * 0.9)
+        ascent, descent = font.getmetrics()
+        line_height = ascent + descent + 2 * stroke
+        text_width = max(font.getlength(line) for line in lines) + 2 * stroke
+        width = min(frame_width, int(text_width) + 2 * padding)
+        height = line_height * len(lines) + 2 * padding
+
+        return {
+            "size": [width, height],
+            "position": [(frame_width - width) // 2, int(frame_height * 0.85) - padding],
+            "lines": [
+                {"text": line, "x": int((width - font.getlength(line)) / 2), "y": padding + stroke + index * line_height}
+                for index, line in enumerate(lines)
+            ],
+        }
+
+    @staticmethod
+    def draw(layout, style):
+        """Draw the box and the white, black-outlined text of a laid out caption."""
+        font = CaptionCache.load_font(tuple(style["font_files"]), style["font_size"])
+        box_alpha = round(255 * style["box_opacity"])
+        image = Image.new("RGBA", tuple(layout["size"]), (0, 0, 0, box_alpha))
+        draw = ImageDraw.Draw(image)
+        for line in layout["lines"]:
+            draw.text(
+                (line["x"], line["y"]), line["text"], font=font, fill=(255, 255, 255, 255),
+                stroke_width=style["stroke_width"], stroke_fill=(0, 0, 0, 255)
+            )
+        return image
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def render(self, text, frame_size, style):
+        """
+        Return (path, layout) of the rendered caption, rendering it only on a cache miss.
+
+        :param frame_size: (width, height) of the frames the caption goes on
+        :param style: Dict with font_files, font_size, padding, stroke_width and box_opacity
+        """
+        entry_path = self._entry_path(self.make_key(text, frame_size, style))
+        try:
+            os.utime(entry_path)
+            with Image.open(entry_path) as image:
+                return entry_path, json.loads(image.text["layout"])
+        except (OSError, KeyError, ValueError):
+            # Missing, or left unreadable by a crash mid-write; render it again
+            pass
+
+        layout = self.layout(text, frame_size, style)
+        info = PngInfo()
+        info.add_text("layout", json.dumps(layout))
+        png = io.BytesIO()
+        self.draw(layout, style).save(png, format="PNG", pnginfo=info)
+        # Atomic, so two workers rendering the same title never leave a mix of both behind
+        FileUtil.write_atomically(entry_path, png.getvalue())
+        self.evict()
+        return entry_path, layout
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in max_bytes."""
+        with self.lock:
+            FileUtil.evict_least_recently_used(self.cache_dir, ".png", self.max_bytes)
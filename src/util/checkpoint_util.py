@@ -0,0 +1,210 @@
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from src.constants.constants import CHECKPOINT_PATH, CLIP_CHECKPOINT_PATH
+from src.util.file_util import FileUtil
+
+class CheckpointUtil:
+    """
+    Records how far each subreddit and each clip of a run got, so a crashed run can pick up where it stopped.
+
+    Subreddits move through LISTED (download folder chosen), DOWNLOADED, STITCHED, RECORDED (in the batch
+    upload file) and UPLOADED. Every subreddit update rewrites the JSON file through a temporary file, so
+    it is never half written, while holding a lock on a file next to it, so updates from worker processes
+    sharing the output folder are never lost.
+
+    Clips are keyed by their download folder and filename and move through DOWNLOADED and ENCODED. There
+    is a change per clip and stage, so they are rows in SQLite: an update writes one row instead of the
+    whole checkpoint.
+    """
+    LISTED = "listed"
+    DOWNLOADED = "downloaded"
+    ENCODED = "encoded"
+    STITCHED = "stitched"
+    RECORDED = "recorded"
+    UPLOADED = "uploaded"
+
+    # Stages of a subreddit that failed before it was recorded, which the next run picks up again
+    INCOMPLETE_STAGES = (LISTED, DOWNLOADED, STITCHED)
+
+    CLIP_FIELDS = ("stage", "post_id", "title", "duration", "encoded_path")
+
+    lock = threading.Lock()
+
+    @staticmethod
+    @contextmanager
+    def _locked(path=CHECKPOINT_PATH):
+        """Hold the checkpoint for a read-modify-write, against other threads and other processes."""
+        with CheckpointUtil.lock:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(f"{path}.lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _load(path=CHECKPOINT_PATH):
+        if not os.path.exists(path):
+            return {"run": None, "subreddits": {}}
+        with open(path, "r") as f:
+            state = json.load(f)
+        state.setdefault("run", None)
+        state.setdefault("subreddits", {})
+        # Clips were kept in this file before they moved to SQLite
+        state.pop("clips", None)
+        return state
+
+    @staticmethod
+    def _save(state, path=CHECKPOINT_PATH):
+        FileUtil.write_json_atomically(path, state, indent=4)
+
+    @staticmethod
+    def start_run():
+        """
+        Resume the last run if it crashed, otherwise start a new one. Returns True when resuming.
+
+        A new run keeps the checkpoints of the subreddits the last run failed before recording, so they
+        continue where they stopped. Every other subreddit starts its next episode from scratch.
+        """
+        with CheckpointUtil._locked():
+            state = CheckpointUtil._load()
+            if state["run"] and not state["run"]["finished"]:
+                return True
+            unfinished = {
+                name: checkpoint for name, checkpoint in state["subreddits"].items()
+                if checkpoint.get("stage") in CheckpointUtil.INCOMPLETE_STAGES
+            }
+            CheckpointUtil._save({"run": {"started_at": time.time(), "finished": False}, "subreddits": unfinished})
+
+        # Only the clips of the folders dropped here; other folders may be in use by workers sharing the output tree
+        dropped_folders = [
+            (os.path.normpath(checkpoint["folder"]),) for name, checkpoint in state["subreddits"].items()
+            if name not in unfinished and checkpoint.get("folder")
+        ]
+        with CheckpointUtil._connect_clips() as connection:
+            connection.executemany("DELETE FROM clips WHERE folder = ?", dropped_folders)
+        return False
+
+    @staticmethod
+    def finish_run():
+        """Mark the run as complete, so the next one starts new episodes. Upload progress is still recorded."""
+        with CheckpointUtil._locked():
+            state = CheckpointUtil._load()
+            if state["run"]:
+                state["run"]["finished"] = True
+                CheckpointUtil._save(state)
+
+    @staticmethod
+    def resume_subreddit(subreddit_name, episode):
+        """
+        Return the checkpoint of a subreddit for this episode, starting a fresh one when there is none.
+
+        A checkpoint left by another episode is stale, unless it was already recorded and only the
+        episode increment that follows went through before a crash. Recorded checkpoints only survive
+        into a resumed run, start_run drops them otherwise.
+        """
+        with CheckpointUtil._locked():
+            state = CheckpointUtil._load()
+            checkpoint = state["subreddits"].get(subreddit_name)
+            if checkpoint:
+                recorded = checkpoint["stage"] in (CheckpointUtil.RECORDED, CheckpointUtil.UPLOADED)
+                if checkpoint["episode"] == episode or (recorded and checkpoint["episode"] + 1 == episode):
+                    return checkpoint
+
+            checkpoint = {"episode": episode, "stage": None, "folder": None, "output_path": None, "batch_entry": None}
+            state["subreddits"][subreddit_name] = checkpoint
+            CheckpointUtil._save(state)
+            return checkpoint
+
+    @staticmethod
+    def update_subreddit(subreddit_name, **fields):
+        """Merge fields (stage, folder, output_path, batch_entry, ...) into the checkpoint of a subreddit."""
+        with CheckpointUtil._locked():
+            state = CheckpointUtil._load()
+            state["subreddits"].setdefault(subreddit_name, {"episode": None, "stage": None}).update(fields)
+            CheckpointUtil._save(state)
+
+    @staticmethod
+    def batch_entries(subreddit_names):
+        """The batch upload entries recorded so far, in the given subreddit order."""
+        with CheckpointUtil._locked():
+            subreddits = CheckpointUtil._load()["subreddits"]
+        return [
+            subreddits[name]["batch_entry"] for name in subreddit_names
+            if name in subreddits and subreddits[name].get("batch_entry")
+        ]
+
+    @staticmethod
+    def mark_uploaded(output_path, video_url):
+        """Record that the compilation at output_path is on YouTube."""
+        with CheckpointUtil._locked():
+            state = CheckpointUtil._load()
+            for checkpoint in state["subreddits"].values():
+                if checkpoint.get("output_path") == output_path:
+                    checkpoint["stage"] = CheckpointUtil.UPLOADED
+                    checkpoint["video_url"] = video_url
+            CheckpointUtil._save(state)
+
+    @staticmethod
+    def is_uploaded(output_path):
+        with CheckpointUtil._locked():
+            subreddits = CheckpointUtil._load()["subreddits"].values()
+        return any(
+            checkpoint.get("output_path") == output_path and checkpoint["stage"] == CheckpointUtil.UPLOADED
+            for checkpoint in subreddits
+        )
+
+    @staticmethod
+    @contextmanager
+    def _connect_clips(path=CLIP_CHECKPOINT_PATH):
+        # A connection per operation, like the post index, so threads and worker processes can share the table
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        connection = sqlite3.connect(path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.row_factory = sqlite3.Row
+        try:
+            with connection:
+                connection.execute("""
+                    CREATE TABLE IF NOT EXISTS clips (
+                        folder TEXT NOT NULL,
+                        filename TEXT NOT NULL,
+                        stage TEXT,
+                        post_id TEXT,
+                        title TEXT,
+                        duration REAL,
+                        encoded_path TEXT,
+                        updated_at REAL NOT NULL,
+                        PRIMARY KEY (folder, filename)
+                    )
+                """)
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def get_clips(folder):
+        """Return the clip checkpoints of a download folder, keyed by filename."""
+        with CheckpointUtil._connect_clips() as connection:
+            rows = connection.execute("SELECT * FROM clips WHERE folder = ?", (os.path.normpath(folder),)).fetchall()
+        return {row["filename"]: {field: row[field] for field in CheckpointUtil.CLIP_FIELDS} for row in rows}
+
+    @staticmethod
+    def update_clip(folder, filename, **fields):
+        """Merge fields (stage, post_id, title, duration, encoded_path) into the checkpoint of a clip."""
+        unknown = set(fields) - set(CheckpointUtil.CLIP_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown clip checkpoint fields: {', '.join(sorted(unknown))}")
+        columns = ("folder", "filename", "updated_at", *fields)
+        # Only the given fields change, so the download and the encode stage never overwrite each other
+        updates = "".join(f", {field} = excluded.{field}" for field in fields)
+        with CheckpointUtil._connect_clips() as connection:
+            connection.execute(f"""
+                INSERT INTO clips ({", ".join(columns)}) VALUES ({", ".join("?" for _ in columns)})
+                ON CONFLICT (folder, filename) DO UPDATE SET updated_at = excluded.updated_at{updates}
+            """, (os.path.normpath(folder), filename, time.time(), *fields.values()))
@@ -1,9 +1,14 @@
 import json
-import os
+import threading
+from src.util.file_util import FileUtil
+from src.util.metadata_store import MetadataStore
+from src.util.post_index import PostIndex
 from src.util.upload_scheduler_util import UploadSchedulerUtil
 
 class ConfigUtil:
     config_path = "src/configs/subreddit_config.json"
+    # Subreddits finish concurrently, so the config read-modify-write must not interleave
+    config_lock = threading.Lock()
 
     @staticmethod
     def load_subreddit_config(path=config_path):
@@ -14,45 +19,45 @@ class ConfigUtil:
     @staticmethod
     def save_subreddit_config(config):
         """Save the updated subreddit configuration back to the JSON file."""
-        with open(ConfigUtil.config_path, 'w') as f:
-            json.dump(config, f, indent=4)
+        # Written atomically, so a crash never leaves it half written
+        FileUtil.write_json_atomically(ConfigUtil.config_path, config, indent=4)
 
     @staticmethod
-    def increment_episode(subreddit_name):
-        """Increment the episode and update the title in the config."""
-        config = ConfigUtil.load_subreddit_config()
-        
-        if subreddit_name not in config:
-            raise ValueError(f"Configuration for subreddit '{subreddit_name}' not found.")
-        
-        # Get the current episode and increment it by 1
-        current_episode = config[subreddit_name]["episode"]
-        new_episode = current_episode + 1
-        
-        # Update the episode in the config
-        config[subreddit_name]["episode"] = new_episode
-        
-        # Save the updated config back to the file
-        ConfigUtil.save_subreddit_config(config)
+    def increment_episode(subreddit_name, download_folder=None):
+        """
+        Increment the episode and update the title in the config.
+
+        When the episode's download folder is given, its clips are marked as used in the post index
+        so they never show up in a later episode.
+        """
+        with ConfigUtil.config_lock:
+            config = ConfigUtil.load_subreddit_config()
+
+            if subreddit_name not in config:
+                raise ValueError(f"Configuration for subreddit '{subreddit_name}' not found.")
+
+            # Get the current episode and increment it by 1
+            current_episode = config[subreddit_name]["episode"]
+            new_episode = current_episode + 1
+
+            if download_folder:
+                PostIndex().mark_folder_used(download_folder, current_episode)
+
+            # Update the episode in the config
+            config[subreddit_name]["episode"] = new_episode
+
+            # Save the updated config back to the file
+            ConfigUtil.save_subreddit_config(config)
         
         # Return the incremented episode number
         return new_episode
 
     @staticmethod
     def save_metadata(folder, filename, title):
-        """Save video metadata (original title) in a JSON file."""
-        metadata_path = os.path.join(folder, "metadata.json")
-
-        # Load existing metadata if it exists
-        if os.path.exists(metadata_path):
-            with open(metadata_path, "r") as f:
-                metadata = json.load(f)
-        else:
-            metadata = {}
-
-        # Add the new metadata entry
-        metadata[filename] = title
-
-        # Save the updated metadata back to the JSON file
-        with open(metadata_path, "w") as f:
-            json.dump(metadata, f, indent=4)
+        """Save video metadata (original title). Buffered until flush_metadata is called for the folder."""
+        MetadataStore.for_folder(folder).append(filename, title)
+
+    @staticmethod
+    def flush_metadata(folder):
+        """Write the buffered metadata of a folder to disk."""
+        MetadataStore.for_folder(folder).flush()
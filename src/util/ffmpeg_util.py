@@ -0,0 +1,156 @@
+import json
+import os
+import subprocess
+from fractions import Fraction
+from src.util.metrics_util import metrics
+
+class FFmpegUtil:
+
+    @staticmethod
+    def probe_streams(input_path):
+        """
+        Read the stream parameters that decide whether two files can be joined without re-encoding.
+
+        :param input_path: Path to the media file
+        :return: Dict with the video and audio stream parameters, or None if the file could not be probed
+        """
+        command = [
+            "ffprobe", "-v", "error", "-show_entries",
+            "stream=codec_type,codec_name,profile,width,height,pix_fmt,r_frame_rate,time_base,sample_rate,channels",
+            "-of", "json", input_path
+        ]
+        try:
+            with metrics.span("ffprobe"):
+                output = subprocess.check_output(command, stderr=subprocess.DEVNULL)
+            streams = json.loads(output).get("streams", [])
+        except Exception as e:
+            print(f"⚠️ Failed to probe {input_path}: {e}")
+            return None
+
+        video = next((s for s in streams if s.get("codec_type") == "video"), None)
+        audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+        if video is None:
+            return None
+
+        return {
+            "video_codec": video.get("codec_name"),
+            "video_profile": video.get("profile"),
+            "width": video.get("width"),
+            "height": video.get("height"),
+            "pix_fmt": video.get("pix_fmt"),
+            "frame_rate": FFmpegUtil.parse_frame_rate(video.get("r_frame_rate")),
+            "time_base": video.get("time_base"),
+            "audio_codec": audio.get("codec_name") if audio else None,
+            "sample_rate": audio.get("sample_rate") if audio else None,
+            "channels": audio.get("channels") if audio else None,
+        }
+
+    @staticmethod
+    def parse_frame_rate(rate):
+        """Parse an ffprobe rational such as "30000/1001" into a Fraction (0 if unknown)."""
+        try:
+            return Fraction(rate)
+        except (TypeError, ValueError, ZeroDivisionError):
+            return Fraction(0)
+
+    @staticmethod
+    def write_concat_list(input_paths, list_path):
+        with open(list_path, "w", encoding="utf-8") as f:
+            for path in input_paths:
+                # Paths in a concat list are resolved relative to the list file, so always write absolute ones
+                escaped_path = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped_path}'\n")
+
+    @staticmethod
+    def concat_copy(input_paths, output_path):
+        """Join files with the concat demuxer without re-encoding. Inputs must share the same stream parameters."""
+        list_path = f"{output_path}.txt"
+        FFmpegUtil.write_concat_list(input_paths, list_path)
+
+        command = [
+            "ffmpeg", "-f", "concat", "-safe", "0", "-i", list_path,
+            "-c", "copy", "-movflags", "+faststart", output_path, "-y"
+        ]
+        try:
+            with metrics.span("concat"):
+                subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            return output_path
+        except Exception as e:
+            print(f"❌ Error concatenating into {output_path}: {e}")
+            return None
+        finally:
+            os.remove(list_path)
+
+    @staticmethod
+    def concat_stream(input_paths, list_path, consume):
+        """
+        Join files like concat_copy, but mux the result into a pipe instead of a file.
+
+        The output is a fragmented MP4, which needs no seek back to write its index.
+
+        :param consume: Callable reading the joined video from a binary stream, e.g. an upload
+        :return: What consume returned, or None if ffmpeg failed
+        """
+        FFmpegUtil.write_concat_list(input_paths, list_path)
+        command = [
+            "ffmpeg", "-f", "concat", "-safe", "0", "-i", list_path,
+            "-c", "copy", "-movflags", "frag_keyframe+empty_moov+default_base_moof", "-f", "mp4", "pipe:1"
+        ]
+        process = None
+        try:
+            with metrics.span("concat", mode="stream"):
+                process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                result = consume(process.stdout)
+                process.stdout.close()
+                if process.wait() != 0:
+                    raise subprocess.CalledProcessError(process.returncode, command)
+            return result
+        except Exception as e:
+            print(f"❌ Error streaming the concatenation of {list_path}: {e}")
+            return None
+        finally:
+            # The consumer gave up before the end, so nothing reads the pipe any more
+            if process is not None and process.poll() is None:
+                process.kill()
+                process.wait()
+            os.remove(list_path)
+
+    @staticmethod
+    def run_with_progress(command, stage="encode"):
+        """
+        Run an ffmpeg command and record its speed from the machine-readable progress output.
+
+        ffmpeg's stdout is taken over for the progress stream. Raises CalledProcessError when ffmpeg fails.
+
+        :param command: ffmpeg argument list, starting with "ffmpeg"
+        :param stage: Label of the encode speed observations
+        :return: Dict with the last reported progress values (fps, speed, out_time_us, total_size)
+        """
+        # -progress writes key=value lines to stdout about twice a second; -nostats silences the stderr version
+        command = [command[0], "-nostats", "-progress", "pipe:1", *command[1:]]
+        progress = {}
+        with metrics.span("ffmpeg", stage=stage):
+            with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True) as process:
+                for line in process.stdout:
+                    key, _, value = line.strip().partition("=")
+                    if key in ("fps", "speed", "out_time_us", "total_size"):
+                        progress[key] = value
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(process.returncode, command)
+
+        fps = FFmpegUtil.parse_progress_number(progress.get("fps"))
+        # speed is reported as e.g. "2.35x", a multiple of realtime
+        speed = FFmpegUtil.parse_progress_number(progress.get("speed", "").rstrip("x"))
+        if fps:
+            metrics.observe("ffmpeg_fps", fps, stage=stage)
+        if speed:
+            metrics.observe("ffmpeg_speed_realtime", speed, stage=stage)
+        return progress
+
+    @staticmethod
+    def parse_progress_number(value):
+        """Parse a number from ffmpeg's progress output, which uses "N/A" for unknown values (0 if unknown)."""
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
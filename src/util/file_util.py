@@ -0,0 +1,61 @@
+import json
+import os
+import threading
+
+class FileUtil:
+    @staticmethod
+    def write_atomically(path, content, mode=0o666):
+        """
+        Replace a file with content (str or bytes), so readers and crashes never leave it half written.
+
+        The content goes to a temporary file, unique per process and thread so concurrent writers never
+        share one, which is fsynced and then renamed over the file.
+
+        :param mode: Permissions the file is created with (before the umask), e.g. 0o600 for secrets
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            # Created with the final permissions, so the content is never readable by others, not even briefly
+            descriptor = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+            with os.fdopen(descriptor, "wb" if isinstance(content, bytes) else "w") as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    @staticmethod
+    def write_json_atomically(path, data, indent=None):
+        """Serialize data as JSON and replace the file with it atomically."""
+        FileUtil.write_atomically(path, json.dumps(data, indent=indent))
+
+    @staticmethod
+    def evict_least_recently_used(folder, extension, max_bytes):
+        """
+        Delete the files of a folder ending in extension, oldest modification time first, until they fit in max_bytes.
+
+        Caches touch an entry on every hit, so the modification time is its last-used timestamp.
+        """
+        entries = []
+        for name in os.listdir(folder):
+            if not name.endswith(extension):
+                continue
+            try:
+                stat = os.stat(os.path.join(folder, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total_bytes <= max_bytes:
+                break
+            try:
+                os.remove(os.path.join(folder, name))
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
@@ -0,0 +1,81 @@
+import math
+
+class FormatUtil:
+    """
+    Picks the cheapest yt-dlp formats that still satisfy the encode target.
+
+    Every clip is scaled into the encode resolution anyway, so anything above the height it ends up
+    with on screen is wasted bandwidth. Among the formats that reach that height, the one with the
+    lowest bitrate wins, preferring frame rates the encoder does not have to drop frames from.
+    """
+
+    @staticmethod
+    def on_screen_height(width, height, target_width, target_height):
+        """Height a width x height source has once scaled to fit target_width x target_height (never upscaled)."""
+        if not width or not height:
+            return target_height
+        scale = min(target_width / width, target_height / height, 1)
+        return math.ceil(height * scale)
+
+    @staticmethod
+    def bitrate(format_info):
+        # All formats of a clip share its duration, so the bitrate ranks them the same way their size would
+        return format_info.get("tbr") or format_info.get("vbr") or format_info.get("abr") or math.inf
+
+    @staticmethod
+    def pick(candidates, reaches, quality, preferred=lambda _: True):
+        """The lowest-bitrate candidate that reaches the target, else the highest-quality one."""
+        reaching = [f for f in candidates if reaches(f)]
+        if reaching:
+            return min(reaching, key=lambda f: (not preferred(f), FormatUtil.bitrate(f)))
+        return max(candidates, key=lambda f: (quality(f), -FormatUtil.bitrate(f)), default=None)
+
+    @staticmethod
+    def build_selector(min_height, max_frame_rate, min_audio_bitrate, max_bytes=None):
+        """
+        Build a yt-dlp format selector (a callable for the "format" option).
+
+        DASH sources yield a merged pair of the smallest video-only stream reaching min_height and the
+        smallest audio-only stream reaching min_audio_bitrate (kbit/s). Sources without separate streams
+        fall back to the smallest muxed format reaching min_height. Formats known to be larger than
+        max_bytes are never picked.
+        """
+        def fits(f):
+            size = f.get("filesize") or f.get("filesize_approx")
+            return max_bytes is None or size is None or size <= max_bytes
+
+        def reaches_height(f):
+            return (f.get("height") or 0) >= min_height
+
+        def height(f):
+            return f.get("height") or 0
+
+        def within_frame_rate(f):
+            return (f.get("fps") or 0) <= max_frame_rate
+
+        def selector(ctx):
+            formats = [f for f in ctx.get("formats") or [] if fits(f)]
+            videos = [f for f in formats if f.get("vcodec") not in (None, "none") and f.get("acodec") == "none"]
+            audios = [f for f in formats if f.get("acodec") not in (None, "none") and f.get("vcodec") == "none"]
+            muxed = [f for f in formats if f not in videos and f not in audios and f.get("vcodec") != "none"]
+
+            video = FormatUtil.pick(videos, reaches_height, height, within_frame_rate)
+            if video is not None:
+                audio = FormatUtil.pick(audios, lambda f: (f.get("abr") or 0) >= min_audio_bitrate, lambda f: f.get("abr") or 0)
+                if audio is None:
+                    # Silent clips only have a video stream
+                    yield video
+                    return
+                yield {
+                    "format_id": f"{video['format_id']}+{audio['format_id']}",
+                    "ext": "mp4",
+                    "requested_formats": [video, audio],
+                    "protocol": f"{video['protocol']}+{audio['protocol']}",
+                }
+                return
+
+            best = FormatUtil.pick(muxed or formats, reaches_height, height, within_frame_rate)
+            if best is not None:
+                yield best
+
+        return selector
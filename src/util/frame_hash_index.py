@@ -0,0 +1,160 @@
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+from src.constants.constants import (
+    DEDUP_FRAME_SIZE, DEDUP_FRAMES_PER_CLIP, DEDUP_MAX_DISTANCE, FRAME_HASH_INDEX_PATH, FRAME_HASH_TTL_SECONDS
+)
+from src.util.metrics_util import metrics
+
+# Low-frequency corner of the DCT kept for the hash: 8x8 coefficients give 64 bits
+HASH_BITS_SIDE = 8
+
+
+def dct_matrix(size):
+    """Orthonormal DCT-II matrix, so that D @ X @ D.T is the 2D DCT of a size x size block."""
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+DCT = dct_matrix(DEDUP_FRAME_SIZE)
+
+
+def extract_frames(input_path, duration, count=DEDUP_FRAMES_PER_CLIP, size=DEDUP_FRAME_SIZE):
+    """
+    Decode `count` evenly spaced frames as size x size grayscale.
+
+    Frames are sampled by time rather than at the codec keyframes, since a repost is usually re-encoded
+    with different keyframe positions. Returns a (frames, size, size) float32 array, empty on failure.
+    """
+    # One extra frame of headroom, as the listed duration may be rounded up
+    rate = (count + 1) / max(float(duration or 0), 1.0)
+    command = [
+        "ffmpeg", "-v", "error", "-i", input_path,
+        "-vf", f"fps={rate:.6f},scale={size}:{size}:flags=area,format=gray",
+        "-frames:v", str(count), "-f", "rawvideo", "pipe:1"
+    ]
+    try:
+        with metrics.span("ffmpeg", stage="dedup_frames"):
+            raw = subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    except Exception as e:
+        print(f"⚠️ Could not extract frames from {input_path}: {e}")
+        return np.empty((0, size, size), dtype=np.float32)
+
+    frames = np.frombuffer(raw, dtype=np.uint8)
+    frames = frames[: len(frames) // (size * size) * size * size]
+    return frames.reshape(-1, size, size).astype(np.float32)
+
+
+def perceptual_hashes(frames):
+    """
+    64-bit pHash of every frame at once: the 2D DCT of each frame, then one bit per low-frequency
+    coefficient telling whether it is above the median of the block (DC term excluded).
+
+    :param frames: (frames, size, size) array
+    :return: (frames,) uint64 array
+    """
+    coefficients = DCT @ frames @ DCT.T
+    low = coefficients[:, :HASH_BITS_SIDE, :HASH_BITS_SIDE].reshape(len(frames), -1)
+    median = np.median(low[:, 1:], axis=1, keepdims=True)
+    bits = np.packbits(low > median, axis=1)
+    return bits.view(">u8").reshape(-1).astype(np.uint64)
+
+
+class FrameHashIndex:
+    """
+    Perceptual hashes of every clip downloaded lately, to spot reposts before they cost an encode.
+
+    Each clip is described by the hashes of DEDUP_FRAMES_PER_CLIP evenly spaced frames. Two clips are
+    near-duplicates when their frames differ by DEDUP_MAX_DISTANCE bits or less on average, which
+    survives re-encoding, rescaling and watermarks. The hashes are kept in SQLite for
+    FRAME_HASH_TTL_SECONDS and mirrored in memory as one matrix, so a lookup is a single vectorized
+    XOR and popcount over the whole index. Each lookup first appends the rows other workers added since.
+    """
+
+    def __init__(self, path=FRAME_HASH_INDEX_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.post_ids = None
+        self.hashes = None
+        self.last_rowid = 0
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _refresh(self):
+        """Mirror the rows added since the last refresh, by this process or by any other worker."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            if self.hashes is None:
+                # Loaded on first use, so creating the index costs nothing for runs that never download
+                connection.execute("""
+                    CREATE TABLE IF NOT EXISTS clip_hashes (
+                        post_id TEXT PRIMARY KEY,
+                        hashes BLOB NOT NULL,
+                        created_at REAL NOT NULL
+                    )
+                """)
+                connection.execute("DELETE FROM clip_hashes WHERE created_at < ?", (time.time() - FRAME_HASH_TTL_SECONDS,))
+                self.post_ids = []
+                self.hashes = np.empty((0, DEDUP_FRAMES_PER_CLIP), dtype=np.uint64)
+            # Rows only get larger rowids as they are added (or replaced), so this is just the new ones
+            rows = connection.execute(
+                "SELECT rowid, post_id, hashes FROM clip_hashes WHERE rowid > ? ORDER BY rowid", (self.last_rowid,)
+            ).fetchall()
+
+        if not rows:
+            return
+        self.last_rowid = rows[-1][0]
+        rows = [(post_id, blob) for _, post_id, blob in rows if len(blob) == DEDUP_FRAMES_PER_CLIP * 8]
+        self.post_ids.extend(post_id for post_id, _ in rows)
+        new_hashes = np.frombuffer(b"".join(blob for _, blob in rows), dtype=np.uint64).reshape(-1, DEDUP_FRAMES_PER_CLIP)
+        self.hashes = np.vstack([self.hashes, new_hashes])
+
+    def hash_clip(self, input_path, duration):
+        """Hash a clip's sampled frames. Returns None when the clip could not be sampled fully."""
+        frames = extract_frames(input_path, duration)
+        if len(frames) < DEDUP_FRAMES_PER_CLIP:
+            return None
+        # Flat frames (black screens, fades) hash alike whatever the clip, so they prove nothing
+        if (frames.std(axis=(1, 2)) < 1).all():
+            return None
+        return perceptual_hashes(frames)
+
+    def find_duplicate(self, post_id, hashes):
+        """Return the post id of an indexed near-duplicate of the clip (never the post itself), or None."""
+        with self.lock:
+            # Long-lived workers share the index, so clips another worker added since count as well
+            self._refresh()
+            if not len(self.hashes):
+                return None
+            distances = np.bitwise_count(self.hashes ^ hashes[None, :]).mean(axis=1)
+            for index in np.flatnonzero(distances <= DEDUP_MAX_DISTANCE):
+                if self.post_ids[index] != post_id:
+                    return self.post_ids[index]
+        return None
+
+    def add(self, post_id, hashes):
+        """Index a clip, so later copies of it are recognized as duplicates."""
+        with self.lock:
+            if self.hashes is None:
+                self._refresh()
+            with self._connect() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO clip_hashes (post_id, hashes, created_at) VALUES (?, ?, ?)",
+                    (post_id, hashes.astype(np.uint64).tobytes(), time.time())
+                )
+            # Picks up the new row along with any other worker's
+            self._refresh()
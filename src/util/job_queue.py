@@ -0,0 +1,247 @@
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from src.constants.constants import JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_QUEUE_PATH, JOB_RETRY_BACKOFF_SECONDS
+
+class JobQueue:
+    """
+    Durable job queue in SQLite, shared by the coordinator and every worker process.
+
+    Jobs belong to a run and to a group (one subreddit). A job only becomes available once every job of
+    its group with a lower stage is finished, so a subreddit moves through download (0), encode (1),
+    stitch (2) and upload (3) while its clips are encoded by whichever workers are free.
+
+    A claimed job is leased to its worker for JOB_LEASE_SECONDS and kept alive by heartbeats. When a
+    worker dies its lease expires and the next idle worker takes the job over. Failed jobs are retried
+    with exponential backoff until they used up their attempts.
+    """
+    PENDING = "pending"
+    LEASED = "leased"
+    DONE = "done"
+    FAILED = "failed"
+
+    DOWNLOAD = "download"
+    ENCODE = "encode"
+    STITCH = "stitch"
+    UPLOAD = "upload"
+    STAGES = {DOWNLOAD: 0, ENCODE: 1, STITCH: 2, UPLOAD: 3}
+
+    def __init__(self, path=JOB_QUEUE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._transaction() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id TEXT PRIMARY KEY,
+                    config TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id TEXT NOT NULL,
+                    group_key TEXT NOT NULL,
+                    job_key TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    stage INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    available_at REAL NOT NULL,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    result TEXT,
+                    error TEXT,
+                    collected INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL,
+                    UNIQUE (run_id, job_key)
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, available_at)")
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_group ON jobs (run_id, group_key, stage)")
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers never claim the same job
+        connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.row_factory = sqlite3.Row
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _insert_jobs(connection, run_id, jobs):
+        # Re-inserting a job that already exists is a no-op, so a retried job can enqueue its follow-ups again
+        now = time.time()
+        for job in jobs:
+            connection.execute("""
+                INSERT OR IGNORE INTO jobs
+                    (run_id, group_key, job_key, kind, stage, payload, status, max_attempts, available_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                run_id, job["group"], job["key"], job["kind"], JobQueue.STAGES[job["kind"]], json.dumps(job["payload"]),
+                JobQueue.PENDING, job.get("max_attempts", JOB_MAX_ATTEMPTS), now, now
+            ))
+
+    @staticmethod
+    def make_job(kind, group, key, payload):
+        """Describe a job to enqueue. The key identifies it within the run."""
+        return {"kind": kind, "group": group, "key": f"{kind}:{key}", "payload": payload}
+
+    def create_run(self, config, jobs):
+        """Store the config snapshot of a new run with its initial jobs. Returns the run id."""
+        run_id = f"{time.strftime('%Y-%m-%d_%H-%M-%S')}_{uuid.uuid4().hex[:6]}"
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT INTO runs (run_id, config, created_at) VALUES (?, ?, ?)", (run_id, json.dumps(config), time.time())
+            )
+            self._insert_jobs(connection, run_id, jobs)
+        return run_id
+
+    def latest_run(self):
+        """Return (run_id, config) of the most recent run, or None."""
+        with self._transaction() as connection:
+            row = connection.execute("SELECT run_id, config FROM runs ORDER BY created_at DESC LIMIT 1").fetchone()
+        return (row["run_id"], json.loads(row["config"])) if row else None
+
+    def claim(self, worker_id):
+        """
+        Lease the next available job to the worker. Returns the job as a dict, or None when nothing is ready.
+
+        Jobs further along (higher stage) go first, so subreddits finish instead of all starting at once.
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            while True:
+                row = connection.execute("""
+                    SELECT * FROM jobs AS job
+                    WHERE ((job.status = ? AND job.available_at <= ?) OR (job.status = ? AND job.lease_expires < ?))
+                      AND NOT EXISTS (
+                        SELECT 1 FROM jobs AS earlier
+                        WHERE earlier.run_id = job.run_id AND earlier.group_key = job.group_key
+                          AND earlier.stage < job.stage AND earlier.status IN (?, ?)
+                      )
+                    ORDER BY job.stage DESC, job.id
+                    LIMIT 1
+                """, (self.PENDING, now, self.LEASED, now, self.PENDING, self.LEASED)).fetchone()
+                if row is None:
+                    return None
+
+                if row["attempts"] >= row["max_attempts"]:
+                    # Its last worker died holding the lease
+                    connection.execute(
+                        "UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, updated_at = ? WHERE id = ?",
+                        (self.FAILED, row["error"] or "Lease expired on the last attempt", now, row["id"])
+                    )
+                    continue
+
+                connection.execute("""
+                    UPDATE jobs SET status = ?, attempts = attempts + 1, lease_owner = ?, lease_expires = ?, updated_at = ?
+                    WHERE id = ?
+                """, (self.LEASED, worker_id, now + JOB_LEASE_SECONDS, now, row["id"]))
+                job = dict(row)
+                job["payload"] = json.loads(job["payload"])
+                job.update(status=self.LEASED, attempts=job["attempts"] + 1, lease_owner=worker_id)
+                return job
+
+    def heartbeat(self, job, worker_id):
+        """Extend the lease of a running job. Returns False when the lease was lost to another worker."""
+        with self._transaction() as connection:
+            updated = connection.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND lease_owner = ? AND status = ?",
+                (time.time() + JOB_LEASE_SECONDS, time.time(), job["id"], worker_id, self.LEASED)
+            ).rowcount
+        return updated == 1
+
+    def complete(self, job, worker_id, result, follow_ups=()):
+        """
+        Store the result of a job and enqueue the jobs it produced, in one transaction.
+
+        Returns False, without recording anything, when the worker no longer held the lease.
+        """
+        with self._transaction() as connection:
+            updated = connection.execute("""
+                UPDATE jobs SET status = ?, result = ?, lease_owner = NULL, error = NULL, updated_at = ?
+                WHERE id = ? AND lease_owner = ? AND status = ?
+            """, (self.DONE, json.dumps(result), time.time(), job["id"], worker_id, self.LEASED)).rowcount
+            if updated:
+                self._insert_jobs(connection, job["run_id"], follow_ups)
+        return updated == 1
+
+    def fail(self, job, worker_id, error):
+        """Schedule a retry with exponential backoff, or fail the job for good once its attempts are used up."""
+        now = time.time()
+        retry = job["attempts"] < job["max_attempts"]
+        with self._transaction() as connection:
+            connection.execute("""
+                UPDATE jobs SET status = ?, available_at = ?, lease_owner = NULL, error = ?, updated_at = ?
+                WHERE id = ? AND lease_owner = ? AND status = ?
+            """, (
+                self.PENDING if retry else self.FAILED,
+                now + JOB_RETRY_BACKOFF_SECONDS * 2 ** (job["attempts"] - 1),
+                str(error), now, job["id"], worker_id, self.LEASED
+            ))
+        return retry
+
+    def results(self, run_id, group, kind):
+        """Results of the finished jobs of a kind in a group, in the order the jobs were enqueued."""
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT result FROM jobs WHERE run_id = ? AND group_key = ? AND kind = ? AND status = ? ORDER BY id",
+                (run_id, group, kind, self.DONE)
+            ).fetchall()
+        return [json.loads(row["result"]) for row in rows]
+
+    def uncollected(self, run_id, kind):
+        """
+        Finished jobs of a kind the coordinator has not processed yet.
+
+        :return: List of dicts with the job id, group, payload and result
+        """
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT id, group_key, payload, result FROM jobs WHERE run_id = ? AND kind = ? AND status = ? AND collected = 0",
+                (run_id, kind, self.DONE)
+            ).fetchall()
+        return [
+            {"id": row["id"], "group": row["group_key"], "payload": json.loads(row["payload"]), "result": json.loads(row["result"])}
+            for row in rows
+        ]
+
+    def mark_collected(self, job_id):
+        """Record that the coordinator processed a finished job, so it is never processed twice."""
+        with self._transaction() as connection:
+            connection.execute("UPDATE jobs SET collected = 1 WHERE id = ?", (job_id,))
+
+    def status_counts(self, run_id):
+        """Number of jobs of the run in each status."""
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT status, COUNT(*) AS count FROM jobs WHERE run_id = ? GROUP BY status", (run_id,)
+            ).fetchall()
+        return {row["status"]: row["count"] for row in rows}
+
+    def is_finished(self, run_id):
+        """True once no job of the run is waiting or running."""
+        counts = self.status_counts(run_id)
+        return not counts.get(self.PENDING) and not counts.get(self.LEASED)
+
+    def has_open_runs(self):
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT 1 FROM jobs WHERE status IN (?, ?) LIMIT 1", (self.PENDING, self.LEASED)
+            ).fetchone()
+        return row is not None
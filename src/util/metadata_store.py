@@ -0,0 +1,84 @@
+import json
+import os
+import threading
+from src.constants.constants import LEGACY_METADATA_FILENAME, METADATA_BATCH_SIZE, METADATA_FILENAME
+
+class MetadataStore:
+    """
+    Append-only store of clip titles for one download folder, kept as JSON lines in metadata.jsonl.
+
+    Appends are buffered in memory and written in batches. Each flush only appends and fsyncs, so it
+    never rewrites what is already on disk. Reads go through an in-memory index built from one pass over
+    the file. Folders written before this store existed are read from their legacy metadata.json.
+    """
+    _stores = {}
+    _stores_lock = threading.Lock()
+
+    def __init__(self, folder, batch_size=METADATA_BATCH_SIZE):
+        self.folder = folder
+        self.path = os.path.join(folder, METADATA_FILENAME)
+        self.batch_size = batch_size
+        self.buffer = []
+        self.index = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def for_folder(cls, folder):
+        """Return the store shared by everything in this process that works on the folder."""
+        key = os.path.abspath(folder)
+        with cls._stores_lock:
+            if key not in cls._stores:
+                cls._stores[key] = cls(folder)
+            return cls._stores[key]
+
+    def append(self, filename, title):
+        """Record the title of a clip. Written to disk on the next flush, at the latest once the batch is full."""
+        with self.lock:
+            self.buffer.append({"filename": filename, "title": title})
+            if self.index is not None:
+                self.index[filename] = title
+            if len(self.buffer) >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self):
+        """Append the buffered entries to disk."""
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self.buffer:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in self.buffer))
+            f.flush()
+            os.fsync(f.fileno())
+        self.buffer = []
+
+    def _load_index(self):
+        index = {}
+        legacy_path = os.path.join(self.folder, LEGACY_METADATA_FILENAME)
+        if os.path.exists(legacy_path):
+            with open(legacy_path, "r") as f:
+                index.update(json.load(f))
+
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A crash can only ever cut off the last line
+                        continue
+                    index[entry["filename"]] = entry["title"]
+
+        for entry in self.buffer:
+            index[entry["filename"]] = entry["title"]
+        return index
+
+    def get(self, filename, default=None):
+        """Look up the title of a clip."""
+        with self.lock:
+            if self.index is None:
+                self.index = self._load_index()
+            return self.index.get(filename, default)
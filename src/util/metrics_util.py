@@ -0,0 +1,113 @@
+import threading
+import time
+from contextlib import contextmanager
+from src.constants.constants import METRICS_PREFIX
+from src.util.file_util import FileUtil
+
+class Metrics:
+    """
+    In-process run metrics: timed spans, counters and observed values, all keyed by name and labels.
+
+    Recording is a dict update under a lock, cheap enough to leave on in production. At the end of a run
+    the metrics are exported as a JSON report and as a Prometheus textfile for node_exporter.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.spans = {}
+        self.counters = {}
+        self.observations = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    @staticmethod
+    def _summarize(summary, value):
+        summary["count"] += 1
+        summary["sum"] += value
+        summary["max"] = max(summary["max"], value)
+
+    @contextmanager
+    def span(self, name, **labels):
+        """Time the code in the block. Spans with the same name and labels are aggregated."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                summary = self.spans.setdefault(self._key(name, labels), {"count": 0, "sum": 0.0, "max": 0.0})
+                self._summarize(summary, elapsed)
+
+    def increment(self, name, value=1, **labels):
+        """Add to a counter, e.g. bytes moved or clips skipped by reason."""
+        with self.lock:
+            key = self._key(name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def counter(self, name, **labels):
+        """Current value of a counter."""
+        with self.lock:
+            return self.counters.get(self._key(name, labels), 0)
+
+    def observe(self, name, value, **labels):
+        """Record a measured value, e.g. the encode speed of one ffmpeg run."""
+        with self.lock:
+            summary = self.observations.setdefault(self._key(name, labels), {"count": 0, "sum": 0.0, "max": 0.0})
+            self._summarize(summary, value)
+
+    def reset(self):
+        with self.lock:
+            self.started_at = time.time()
+            self.spans.clear()
+            self.counters.clear()
+            self.observations.clear()
+
+    def to_report(self):
+        """Return every metric as a JSON-serializable dict."""
+        def entries(items, value_key):
+            return [{"name": name, "labels": dict(labels), value_key: value} for (name, labels), value in items]
+
+        with self.lock:
+            return {
+                "started_at": self.started_at,
+                "duration_seconds": round(time.time() - self.started_at, 3),
+                "spans": entries(self.spans.items(), "seconds"),
+                "counters": entries(self.counters.items(), "value"),
+                "observations": entries(self.observations.items(), "summary"),
+            }
+
+    def to_prometheus(self):
+        """Render every metric in the Prometheus text exposition format."""
+        def format_labels(labels):
+            if not labels:
+                return ""
+            escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+            return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+        lines = []
+        with self.lock:
+            for (name, labels), summary in sorted(self.spans.items()):
+                span_labels = (("span", name),) + labels
+                lines.append(f"{METRICS_PREFIX}_span_seconds_sum{format_labels(span_labels)} {summary['sum']:.6f}")
+                lines.append(f"{METRICS_PREFIX}_span_seconds_count{format_labels(span_labels)} {summary['count']}")
+                lines.append(f"{METRICS_PREFIX}_span_seconds_max{format_labels(span_labels)} {summary['max']:.6f}")
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"{METRICS_PREFIX}_{name}_total{format_labels(labels)} {value}")
+            for (name, labels), summary in sorted(self.observations.items()):
+                lines.append(f"{METRICS_PREFIX}_{name}_sum{format_labels(labels)} {summary['sum']:.6f}")
+                lines.append(f"{METRICS_PREFIX}_{name}_count{format_labels(labels)} {summary['count']}")
+                lines.append(f"{METRICS_PREFIX}_{name}_max{format_labels(labels)} {summary['max']:.6f}")
+            lines.append(f"{METRICS_PREFIX}_run_started_timestamp_seconds {self.started_at:.0f}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, report_path, prometheus_path):
+        """Write the JSON report and the Prometheus textfile, each replaced atomically."""
+        FileUtil.write_json_atomically(report_path, self.to_report(), indent=4)
+        FileUtil.write_atomically(prometheus_path, self.to_prometheus())
+
+
+# Shared by every stage of the run
+metrics = Metrics()
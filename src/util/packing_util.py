@@ -0,0 +1,54 @@
+import math
+
+class PackingUtil:
+
+    @staticmethod
+    def pack(durations, scores, capacity, slack=0):
+        """
+        Choose clips that fill a duration budget as closely as possible, then score as high as possible.
+
+        This is a 0/1 knapsack over whole seconds: durations are rounded up, so the chosen clips never
+        exceed the capacity. Any total within `slack` seconds of the fullest reachable one counts as full,
+        and among those the highest total score wins, then the fewest clips.
+
+        :param durations: Duration of each candidate in seconds
+        :param scores: Score of each candidate, e.g. its upvotes
+        :param capacity: Budget in seconds
+        :param slack: Seconds of the budget that may be given up for a better score
+        :return: Indices of the chosen candidates, in ascending order
+        """
+        capacity = int(capacity)
+        if capacity <= 0:
+            return []
+
+        # best[total] is the (score, -clips) of the best selection lasting exactly total seconds, chosen[total] the
+        # selection itself as a linked list of (index, rest) tuples shared between totals
+        best = [None] * (capacity + 1)
+        chosen = [None] * (capacity + 1)
+        best[0] = (0, 0)
+        for index, (duration, score) in enumerate(zip(durations, scores)):
+            weight = math.ceil(duration)
+            if weight <= 0 or weight > capacity:
+                continue
+            # Walking the totals downwards uses every candidate at most once
+            for total in range(capacity, weight - 1, -1):
+                previous = best[total - weight]
+                if previous is None:
+                    continue
+                candidate = (previous[0] + score, previous[1] - 1)
+                if best[total] is None or candidate > best[total]:
+                    best[total] = candidate
+                    chosen[total] = (index, chosen[total - weight])
+
+        fullest = max(total for total in range(capacity + 1) if best[total] is not None)
+        total = max(
+            (total for total in range(max(0, fullest - slack), fullest + 1) if best[total] is not None),
+            key=lambda total: (best[total], total)
+        )
+
+        selection = []
+        node = chosen[total]
+        while node is not None:
+            index, node = node
+            selection.append(index)
+        return sorted(selection)
@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from src.constants.constants import POST_INDEX_PATH, POST_INDEX_TTL_SECONDS
+
+class PostIndex:
+    """
+    Local SQLite index of Reddit posts that were already probed, rejected, downloaded or used in an episode.
+
+    Statuses are "rejected" (unusable duration or a repost), "failed" (download failed), "downloaded" and "used".
+    Every status except "used" expires after its TTL in POST_INDEX_TTL_SECONDS, so rejected posts get
+    another chance eventually while used posts never come back. A download keeps its file_path only while
+    the file is there to be reused; its folder is kept to mark it used once its episode is out.
+    """
+    REJECTED = "rejected"
+    FAILED = "failed"
+    DOWNLOADED = "downloaded"
+    USED = "used"
+
+    def __init__(self, path=POST_INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS posts (
+                    post_id TEXT PRIMARY KEY,
+                    url TEXT,
+                    subreddit TEXT,
+                    duration REAL,
+                    status TEXT NOT NULL,
+                    file_path TEXT,
+                    folder TEXT,
+                    episode INTEGER,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            columns = {row["name"] for row in connection.execute("PRAGMA table_info(posts)")}
+            if "folder" not in columns:
+                # Indexes written before downloads were deleted once encoded only have file_path
+                connection.execute("ALTER TABLE posts ADD COLUMN folder TEXT")
+            connection.execute("CREATE INDEX IF NOT EXISTS posts_url ON posts (url)")
+            connection.execute("CREATE INDEX IF NOT EXISTS posts_file_path ON posts (file_path)")
+            connection.execute("CREATE INDEX IF NOT EXISTS posts_folder ON posts (folder)")
+
+    @contextmanager
+    def _connect(self):
+        # A connection per operation keeps the index safe to use from several threads and processes
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.row_factory = sqlite3.Row
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _is_expired(self, row):
+        ttl = POST_INDEX_TTL_SECONDS.get(row["status"])
+        return ttl is not None and time.time() - row["updated_at"] > ttl
+
+    def lookup(self, post_id, url=None):
+        """Return the most recent unexpired entry for the post id (or for the same URL), as a dict."""
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT * FROM posts WHERE post_id = ? OR url = ? ORDER BY updated_at DESC",
+                (post_id, url)
+            ).fetchall()
+
+        for row in rows:
+            # A post used in an episode blocks every repost of the same URL as well
+            if row["status"] == self.USED:
+                return dict(row)
+        for row in rows:
+            if not self._is_expired(row):
+                return dict(row)
+        return None
+
+    def record(self, post_id, url, subreddit, status, duration=None, file_path=None):
+        """Insert or update the entry for a post. Entries already used in an episode are never downgraded."""
+        folder = None
+        if file_path is not None:
+            file_path = os.path.normpath(file_path)
+            folder = os.path.dirname(file_path)
+        with self._connect() as connection:
+            connection.execute("""
+                INSERT INTO posts (post_id, url, subreddit, duration, status, file_path, folder, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (post_id) DO UPDATE SET
+                    url = excluded.url,
+                    duration = COALESCE(excluded.duration, posts.duration),
+                    status = excluded.status,
+                    file_path = COALESCE(excluded.file_path, posts.file_path),
+                    folder = COALESCE(excluded.folder, posts.folder),
+                    updated_at = excluded.updated_at
+                WHERE posts.status != 'used'
+            """, (post_id, url, subreddit, duration, status, file_path, folder, time.time()))
+
+    def release_file(self, file_path):
+        """Forget a downloaded file that was deleted, so it is never offered for reuse."""
+        with self._connect() as connection:
+            connection.execute("UPDATE posts SET file_path = NULL WHERE file_path = ?", (os.path.normpath(file_path),))
+
+    def mark_folder_used(self, folder, episode):
+        """Mark every post downloaded into the folder as used by the given episode. Returns the number of posts."""
+        folder = os.path.normpath(folder)
+        prefix = os.path.join(folder, "")
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "UPDATE posts SET status = ?, episode = ?, updated_at = ? WHERE folder = ? OR substr(file_path, 1, ?) = ?",
+                (self.USED, episode, time.time(), folder, len(prefix), prefix)
+            )
+            return cursor.rowcount
+
+    def prune(self):
+        """Delete expired entries. Called once per run."""
+        now = time.time()
+        with self._connect() as connection:
+            for status, ttl in POST_INDEX_TTL_SECONDS.items():
+                connection.execute("DELETE FROM posts WHERE status = ? AND updated_at < ?", (status, now - ttl))
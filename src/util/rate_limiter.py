@@ -0,0 +1,39 @@
+import threading
+import time
+
+class TokenBucket:
+    """Thread-safe token bucket used to pace requests against an API budget."""
+
+    def __init__(self, rate_per_second: float, capacity: int):
+        """
+        :param rate_per_second: Number of tokens refilled every second
+        :param capacity: Maximum number of tokens the bucket can hold (burst size)
+        """
+        if rate_per_second <= 0 or capacity <= 0:
+            raise ValueError("Token bucket rate and capacity must be positive.")
+
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate_per_second)
+        self.last_refill = now
+
+    def acquire(self, tokens: int = 1):
+        """Block until the requested number of tokens is available, then consume them."""
+        if tokens > self.capacity:
+            raise ValueError("Cannot acquire more tokens than the bucket capacity.")
+
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait_time = (tokens - self.tokens) / self.rate_per_second
+            time.sleep(wait_time)
@@ -0,0 +1,62 @@
+import os
+import threading
+from contextlib import contextmanager
+from src.constants.constants import FFMPEG_THREADS_PER_JOB, NETWORK_SLOTS_PER_CORE
+
+class ResourceBudget:
+    """Counting semaphore where each job can take several units (e.g. the threads of one ffmpeg process)."""
+
+    def __init__(self, capacity):
+        self.capacity = max(1, capacity)
+        self.available = self.capacity
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, units=1):
+        # A job asking for more than the whole budget still runs, it just runs alone
+        units = min(max(1, units), self.capacity)
+        with self.condition:
+            self.condition.wait_for(lambda: self.available >= units)
+            self.available -= units
+        try:
+            yield units
+        finally:
+            with self.condition:
+                self.available += units
+                self.condition.notify_all()
+
+
+class ResourceScheduler:
+    """
+    Separate budgets for CPU-bound work (encodes) and network-bound work (listings, downloads, uploads).
+
+    The CPU budget is one unit per core and every ffmpeg job reserves as many units as the threads it is
+    allowed to use, so concurrent subreddits together never run more encoder threads than there are cores.
+    """
+
+    def __init__(self, cpu_count=None):
+        self.cpu_count = cpu_count or os.cpu_count() or 1
+        self.cpu_budget = ResourceBudget(self.cpu_count)
+        self.network_budget = ResourceBudget(self.cpu_count * NETWORK_SLOTS_PER_CORE)
+
+    @property
+    def ffmpeg_threads(self):
+        """Threads allocated to a single ffmpeg job."""
+        return min(FFMPEG_THREADS_PER_JOB, self.cpu_count)
+
+    @property
+    def encoder_slots(self):
+        """Number of ffmpeg jobs that fit in the CPU budget at once."""
+        return max(1, self.cpu_count // self.ffmpeg_threads)
+
+    def cpu(self, threads=None):
+        """Reserve CPU for a job using the given number of threads (defaults to one ffmpeg job)."""
+        return self.cpu_budget.reserve(threads or self.ffmpeg_threads)
+
+    def network(self):
+        """Reserve one network slot."""
+        return self.network_budget.reserve(1)
+
+
+# Shared by every subreddit processed in this process
+scheduler = ResourceScheduler()
@@ -0,0 +1,117 @@
+import os
+import shutil
+import threading
+from src.constants.constants import (
+    DELETE_CONSUMED_INTERMEDIATES, SCRATCH_ADMISSION_TIMEOUT_SECONDS, SCRATCH_BUDGET_BYTES, SCRATCH_TMPFS_ROOT
+)
+from src.util.metrics_util import metrics
+
+OUTPUT_ROOT = "output"
+
+class ScratchSpace:
+    """
+    Where downloads and encodes live until the next stage has consumed them.
+
+    Intermediates (raw clips, per-clip encodes, segments) are tracked from the moment they are complete
+    until their consumer is done with them, and then deleted. Downloads are admitted only while the
+    downloads not yet encoded fit in the budget, so a fast downloader cannot fill the disk ahead of the
+    encoders. Encodes waiting for the concat do not count, as only the end of the downloads lets the
+    concat free them. Compilations are kept under OUTPUT_ROOT whatever the scratch root is.
+
+    With a tmpfs root (e.g. /dev/shm), intermediates never reach the disk. The budget is then capped
+    at half of the tmpfs, which is memory.
+    """
+
+    def __init__(self, budget_bytes=SCRATCH_BUDGET_BYTES, tmpfs_root=SCRATCH_TMPFS_ROOT, delete_consumed=DELETE_CONSUMED_INTERMEDIATES):
+        self.root = OUTPUT_ROOT
+        self.budget_bytes = budget_bytes
+        if tmpfs_root and os.path.isdir(tmpfs_root):
+            # Keeping the "output" component keeps S3 keys derived from the path unchanged
+            self.root = os.path.join(tmpfs_root, OUTPUT_ROOT)
+            self.budget_bytes = min(budget_bytes, shutil.disk_usage(tmpfs_root).total // 2)
+        elif tmpfs_root:
+            print(f"⚠️ Scratch tmpfs {tmpfs_root} does not exist, keeping intermediates under {OUTPUT_ROOT}")
+        self.delete_consumed = delete_consumed
+        self.sizes = {}
+        self.awaiting_encode = set()
+        self.condition = threading.Condition()
+
+    def path(self, *parts):
+        """Path of a file or folder in scratch space."""
+        return os.path.join(self.root, *parts)
+
+    def persistent_path(self, scratch_path):
+        """The path under OUTPUT_ROOT matching a scratch path, for outputs that must outlive the scratch space."""
+        relative_path = os.path.relpath(scratch_path, self.root)
+        if relative_path.startswith(os.pardir):
+            return scratch_path
+        return os.path.join(OUTPUT_ROOT, relative_path)
+
+    def _awaiting_encode_bytes(self):
+        """Bytes held by downloads no encoder has released yet, which is what download admission looks at."""
+        return sum(self.sizes.get(path, 0) for path in self.awaiting_encode)
+
+    def track(self, path, awaiting_encode=False):
+        """
+        Count a finished intermediate until it is consumed.
+
+        :param awaiting_encode: The file is a download an encoder still has to release. Tracking the same
+            path again without it (a clip passed through as is) releases it for admission, like consume does.
+        """
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        with self.condition:
+            path = os.path.abspath(path)
+            self.sizes[path] = size
+            if awaiting_encode:
+                self.awaiting_encode.add(path)
+            elif path in self.awaiting_encode:
+                self.awaiting_encode.discard(path)
+                self.condition.notify_all()
+
+    def consume(self, path):
+        """
+        The next stage is done with an intermediate: delete it and release its share of the budget.
+
+        :return: True when the file was deleted
+        """
+        deleted = False
+        if self.delete_consumed:
+            try:
+                os.remove(path)
+                deleted = True
+                metrics.increment("scratch_bytes_freed", self.sizes.get(os.path.abspath(path), 0))
+            except FileNotFoundError:
+                pass
+        with self.condition:
+            self.sizes.pop(os.path.abspath(path), None)
+            self.awaiting_encode.discard(os.path.abspath(path))
+            self.condition.notify_all()
+        return deleted
+
+    def wait_for_space(self):
+        """
+        Block until the downloads not yet encoded fit in the budget, so a new download may start.
+
+        Only worth calling while a consumer runs alongside. Waits at most SCRATCH_ADMISSION_TIMEOUT_SECONDS,
+        after which the download goes ahead anyway rather than stall the run.
+        """
+        with self.condition:
+            if self._awaiting_encode_bytes() < self.budget_bytes:
+                return True
+            print(f"⏸️ Scratch space is full ({self.budget_bytes / 1024 ** 3:.1f} GiB), waiting for the encoders")
+            metrics.increment("downloads_paused")
+            with metrics.span("scratch_wait"):
+                admitted = self.condition.wait_for(
+                    lambda: self._awaiting_encode_bytes() < self.budget_bytes, timeout=SCRATCH_ADMISSION_TIMEOUT_SECONDS
+                )
+        if not admitted:
+            print("⚠️ Scratch space is still over budget, downloading anyway")
+            metrics.increment("scratch_budget_overruns")
+        return admitted
+
+
+# Shared by every subreddit processed in this process
+scratch = ScratchSpace()
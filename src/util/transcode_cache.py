@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from src.util.file_util import FileUtil
+
+class TranscodeCache:
+    """
+    On-disk cache of encoded clips keyed by the source content hash and the encode settings.
+
+    Entries are evicted least-recently-used first once the cache grows past max_bytes. The file
+    modification time doubles as the last-used timestamp, so no separate index has to be kept in sync.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def hash_file(path, chunk_size=1024 * 1024):
+        """Return the SHA-256 hex digest of a file's content."""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def make_key(self, input_path, settings):
+        """Build the cache key from the source content and the encode settings (a JSON-serializable dict)."""
+        digest = hashlib.sha256(self.hash_file(input_path).encode())
+        digest.update(json.dumps(settings, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.mp4")
+
+    def fetch(self, key, output_path):
+        """Place the cached encode at output_path. Returns False on a cache miss."""
+        entry_path = self._entry_path(key)
+        try:
+            os.utime(entry_path)
+            self._link_or_copy(entry_path, output_path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def store(self, key, encoded_path):
+        """Add an encoded file to the cache and evict old entries if the cache is over budget."""
+        entry_path = self._entry_path(key)
+        temp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            self._link_or_copy(encoded_path, temp_path)
+            os.replace(temp_path, entry_path)
+        except OSError as e:
+            print(f"⚠️ Failed to cache {encoded_path}: {e}")
+            return
+        self.evict()
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in max_bytes."""
+        with self.lock:
+            FileUtil.evict_least_recently_used(self.cache_dir, ".mp4", self.max_bytes)
+
+    @staticmethod
+    def _link_or_copy(source_path, destination_path):
+        """Hard-link when possible so cache hits cost no I/O, fall back to a copy across filesystems."""
+        if os.path.exists(destination_path):
+            os.remove(destination_path)
+        try:
+            os.link(source_path, destination_path)
+        except OSError:
+            shutil.copyfile(source_path, destination_path)
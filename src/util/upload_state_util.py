@@ -0,0 +1,103 @@
+import datetime
+import json
+import os
+import threading
+import pytz
+from src.constants.constants import UPLOAD_STATE_PATH, YOUTUBE_DAILY_QUOTA
+from src.util.file_util import FileUtil
+
+class UploadStateUtil:
+    """
+    Persists resumable upload sessions and the YouTube quota spent today in one JSON file.
+
+    Sessions are keyed by the local file path and remember the file's size and modification time, so a
+    session is only resumed for the exact file it was started for.
+    """
+    lock = threading.Lock()
+
+    @staticmethod
+    def _load(path=UPLOAD_STATE_PATH):
+        if not os.path.exists(path):
+            return {"sessions": {}, "quota": {}}
+        with open(path, "r") as f:
+            state = json.load(f)
+        state.setdefault("sessions", {})
+        state.setdefault("quota", {})
+        return state
+
+    @staticmethod
+    def _save(state, path=UPLOAD_STATE_PATH):
+        # Written atomically, so a crash never leaves a truncated state file behind
+        FileUtil.write_json_atomically(path, state, indent=4)
+
+    @staticmethod
+    def _file_signature(file_path):
+        stat = os.stat(file_path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    @staticmethod
+    def get_session(file_path):
+        """Return the saved session (resumable_uri, progress) for the file, or None if it changed or never started."""
+        with UploadStateUtil.lock:
+            session = UploadStateUtil._load()["sessions"].get(file_path)
+        if not session or not os.path.exists(file_path):
+            return None
+        signature = UploadStateUtil._file_signature(file_path)
+        if session["size"] != signature["size"] or session["mtime"] != signature["mtime"]:
+            return None
+        return session
+
+    @staticmethod
+    def save_session(file_path, resumable_uri, progress):
+        """Remember how far the upload of a file got."""
+        with UploadStateUtil.lock:
+            state = UploadStateUtil._load()
+            state["sessions"][file_path] = {
+                **UploadStateUtil._file_signature(file_path),
+                "resumable_uri": resumable_uri,
+                "progress": progress,
+            }
+            UploadStateUtil._save(state)
+
+    @staticmethod
+    def clear_session(file_path):
+        """Forget the session of a file once its upload has completed."""
+        with UploadStateUtil.lock:
+            state = UploadStateUtil._load()
+            if state["sessions"].pop(file_path, None) is not None:
+                UploadStateUtil._save(state)
+
+    @staticmethod
+    def _quota_day():
+        # The YouTube Data API quota resets at midnight Pacific time
+        return datetime.datetime.now(pytz.timezone("US/Pacific")).date().isoformat()
+
+    @staticmethod
+    def remaining_quota():
+        """Quota units still available today."""
+        with UploadStateUtil.lock:
+            used = UploadStateUtil._load()["quota"].get(UploadStateUtil._quota_day(), 0)
+        return max(0, YOUTUBE_DAILY_QUOTA - used)
+
+    @staticmethod
+    def reserve_quota(cost):
+        """Spend quota units for today. Returns False, without spending, when not enough are left."""
+        with UploadStateUtil.lock:
+            state = UploadStateUtil._load()
+            day = UploadStateUtil._quota_day()
+            used = state["quota"].get(day, 0)
+            if used + cost > YOUTUBE_DAILY_QUOTA:
+                return False
+            # Only today's counter is worth keeping
+            state["quota"] = {day: used + cost}
+            UploadStateUtil._save(state)
+            return True
+
+    @staticmethod
+    def refund_quota(cost):
+        """Give back units reserved for a request that was never sent."""
+        with UploadStateUtil.lock:
+            state = UploadStateUtil._load()
+            day = UploadStateUtil._quota_day()
+            state["quota"][day] = max(0, state["quota"].get(day, 0) - cost)
+            UploadStateUtil._save(state)
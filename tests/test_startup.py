@@ -0,0 +1,39 @@
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# cron runs each step on its own, so none of them may pay for the clients of the others at startup
+HEAVY_MODULES = ("praw", "boto3", "moviepy", "yt_dlp", "googleapiclient")
+STARTUP_BUDGET_SECONDS = 1.0
+ENTRY_MODULES = ("src.cli", "src.controller.merge_controller", "src.controller.download_controller")
+
+PROBE = """
+import importlib, json, sys, time
+started = time.perf_counter()
+for module in sys.argv[1:]:
+    importlib.import_module(module)
+print(json.dumps({"seconds": time.perf_counter() - started, "modules": sorted(sys.modules)}))
+"""
+
+
+def import_in_subprocess(modules):
+    """Import the modules in a fresh interpreter. Returns the seconds it took and the modules loaded."""
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE, *modules], cwd=REPO_ROOT, check=True, capture_output=True, text=True
+    )
+    report = json.loads(result.stdout.splitlines()[-1])
+    return report["seconds"], set(report["modules"])
+
+
+def test_entry_points_load_no_heavy_clients():
+    _, modules = import_in_subprocess(ENTRY_MODULES)
+    loaded = [name for name in HEAVY_MODULES if name in modules]
+    assert not loaded, f"Importing the entry points loads {', '.join(loaded)}"
+
+
+def test_entry_points_import_within_budget():
+    # The best of a few runs, so a busy machine does not fail the test
+    seconds = min(import_in_subprocess(ENTRY_MODULES)[0] for _ in range(3))
+    assert seconds < STARTUP_BUDGET_SECONDS, f"Importing the entry points took {seconds:.2f}s"
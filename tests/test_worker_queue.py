@@ -0,0 +1,159 @@
+import json
+import os
+import sqlite3
+import time
+
+import src.controller.coordinator_controller as coordinator_controller
+import src.controller.worker_controller as worker_controller
+import src.util.job_queue as job_queue
+from src.util.config_util import ConfigUtil
+from src.util.job_queue import JobQueue
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENCODES_PER_SUBREDDIT = 3
+ENCODE_SECONDS = 0.2
+# The abandoned subreddit's download is claimed by a worker that dies before running it
+ABANDONED = "abandoned"
+CONFIG = {
+    "zeta": {"episode": 4, "title": "Zeta"},
+    ABANDONED: {"episode": 1, "title": "Abandoned"},
+    "alpha": {"episode": 7, "title": "Alpha"},
+}
+
+# Spawned workers import this module to unpickle the handlers, so they run with these timings too
+job_queue.JOB_RETRY_BACKOFF_SECONDS = 0
+worker_controller.WORKER_POLL_SECONDS = 0.05
+
+
+def log_execution(queue, job, **fields):
+    """Append a line to the execution log next to the queue database, shared by every worker process."""
+    entry = {"key": job["job_key"], "attempt": job["attempts"], "worker": os.getpid(), "at": time.time(), **fields}
+    with open(os.path.join(os.path.dirname(queue.path), "executions.jsonl"), "a") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def download_stub(queue, job):
+    log_execution(queue, job)
+    group = job["group_key"]
+    follow_ups = [
+        JobQueue.make_job(JobQueue.ENCODE, group, f"{group}:{index}", {"fail_once": index == 0})
+        for index in range(ENCODES_PER_SUBREDDIT)
+    ]
+    return {}, follow_ups
+
+
+def encode_stub(queue, job):
+    if job["payload"]["fail_once"] and job["attempts"] == 1:
+        log_execution(queue, job, failed=True)
+        raise RuntimeError("encoder crashed")
+    time.sleep(ENCODE_SECONDS)
+    log_execution(queue, job)
+    return {"worker": os.getpid()}, []
+
+
+def stitch_stub(queue, job):
+    group = job["group_key"]
+    log_execution(queue, job, encodes=len(queue.results(job["run_id"], group, JobQueue.ENCODE)))
+    result = {"output_path": f"{group}.mp4", "folder": group, "upload_details": job["payload"]["upload_details"]}
+    return result, []
+
+
+HANDLERS = {JobQueue.DOWNLOAD: download_stub, JobQueue.ENCODE: encode_stub, JobQueue.STITCH: stitch_stub}
+
+
+def enqueue(queue):
+    jobs = []
+    for subreddit_name, upload_details in CONFIG.items():
+        payload = {"upload_details": upload_details}
+        jobs.append(JobQueue.make_job(JobQueue.DOWNLOAD, subreddit_name, subreddit_name, payload))
+        jobs.append(JobQueue.make_job(JobQueue.STITCH, subreddit_name, subreddit_name, payload))
+    return queue.create_run(CONFIG, jobs)
+
+
+def abandon_download(queue):
+    """Lease the abandoned subreddit's download to a worker that never reports back, and let the lease run out."""
+    claimed = [queue.claim("dead-worker")]
+    while claimed[-1]["group_key"] != ABANDONED:
+        claimed.append(queue.claim("dead-worker"))
+    job = claimed.pop()
+    # The downloads claimed on the way are put back untouched, so only the abandoned one looks like a dead worker's
+    with sqlite3.connect(queue.path) as connection:
+        connection.executemany(
+            "UPDATE jobs SET status = ?, attempts = 0, lease_owner = NULL WHERE id = ?",
+            [(JobQueue.PENDING, other["id"]) for other in claimed]
+        )
+    with sqlite3.connect(queue.path) as connection:
+        connection.execute("UPDATE jobs SET lease_expires = 0 WHERE id = ?", (job["id"],))
+    return job
+
+
+def test_workers_share_a_run(tmp_path, monkeypatch):
+    # The workers write their metrics under the working directory and import src from the repo
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(REPO_ROOT)
+    queue = JobQueue(str(tmp_path / "job_queue.db"))
+    run_id = enqueue(queue)
+    abandoned = abandon_download(queue)
+
+    assert worker_controller.worker_controller(processes=2, exit_when_idle=True, handlers=HANDLERS, queue_path=queue.path)
+
+    with open(tmp_path / "executions.jsonl") as f:
+        executions = [json.loads(line) for line in f]
+    succeeded = [execution for execution in executions if not execution.get("failed")]
+    keys = [execution["key"] for execution in succeeded]
+    # Every job finished, each run to completion by exactly one worker
+    assert sorted(keys) == sorted(set(keys))
+    assert len(keys) == len(CONFIG) * (2 + ENCODES_PER_SUBREDDIT)
+    assert queue.status_counts(run_id) == {JobQueue.DONE: len(keys)}
+
+    for subreddit_name in CONFIG:
+        encodes = [execution for execution in succeeded if execution["key"].startswith(f"encode:{subreddit_name}:")]
+        stitch = next(execution for execution in succeeded if execution["key"] == f"stitch:{subreddit_name}")
+        # The stitch waited for every encode of its subreddit, including the retried one
+        assert stitch["encodes"] == ENCODES_PER_SUBREDDIT
+        assert stitch["at"] >= max(encode["at"] for encode in encodes)
+
+        retried = [execution for execution in executions if execution["key"] == f"encode:{subreddit_name}:0"]
+        assert [(execution["attempt"], bool(execution.get("failed"))) for execution in retried] == [(1, True), (2, False)]
+
+    # The dead worker's attempt counts, and a live worker took the expired lease over
+    taken_over = next(execution for execution in executions if execution["key"] == abandoned["job_key"])
+    assert taken_over["attempt"] == 2
+    assert taken_over["worker"] != os.getpid()
+
+
+def test_collect_run_writes_the_batch_in_config_order(tmp_path, monkeypatch):
+    # The post index enqueueing prunes lives under the working directory
+    monkeypatch.chdir(tmp_path)
+    batch_upload_path = tmp_path / "batch_upload.json"
+    monkeypatch.setattr(coordinator_controller, "BATCH_UPLOAD_PATH", str(batch_upload_path))
+    config = json.loads(json.dumps(CONFIG))
+    incremented = []
+
+    def increment_episode(subreddit_name, download_folder=None):
+        incremented.append((subreddit_name, download_folder))
+        config[subreddit_name]["episode"] += 1
+
+    monkeypatch.setattr(ConfigUtil, "load_subreddit_config", staticmethod(lambda *args: config))
+    monkeypatch.setattr(ConfigUtil, "increment_episode", staticmethod(increment_episode))
+    queue = JobQueue(str(tmp_path / "job_queue.db"))
+    run_id, snapshot = coordinator_controller.enqueue_run(queue)
+
+    stitches = []
+    while (job := queue.claim("worker")) is not None:
+        if job["kind"] == JobQueue.STITCH:
+            stitches.append(job)
+        else:
+            queue.complete(job, "worker", {})
+    # Subreddits finish in the reverse of the config order
+    for stitch in reversed(stitches):
+        queue.complete(stitch, "worker", stitch_stub(queue, stitch)[0])
+
+    batch_uploads = coordinator_controller.collect_run(queue, run_id, snapshot)
+    # Collecting again increments nothing twice
+    assert coordinator_controller.collect_run(queue, run_id, snapshot) == batch_uploads
+
+    assert [entry["output_path"] for entry in batch_uploads] == [f"{name}.mp4" for name in CONFIG]
+    with open(batch_upload_path) as f:
+        assert json.load(f) == batch_uploads
+    assert sorted(incremented) == sorted((name, name) for name in CONFIG)
@@ -0,0 +1,59 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("yt_dlp")
+
+from src.client.ytdlp_session import YtDlpSession
+from src.util.metrics_util import metrics
+
+BODY = b"clip"
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connection open between requests, like the CDNs clips come from
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.send_header("Set-Cookie", "session=shared; Path=/")
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+def test_requests_reuse_one_connection(server_url):
+    # Reads yt-dlp internals; an upgrade that moves them leaves the session with no HTTP sessions to count
+    session = YtDlpSession()
+    opened_before = metrics.counter("http_connections_opened", client="yt-dlp")
+    requests_before = metrics.counter("http_requests", client="yt-dlp")
+
+    for _ in range(3):
+        assert session.ydl.urlopen(server_url).read() == BODY
+    assert session._http_sessions(), "yt-dlp no longer exposes the HTTP sessions record_connections reads"
+    session.record_connections()
+
+    assert metrics.counter("http_connections_opened", client="yt-dlp") - opened_before == 1
+    assert metrics.counter("http_requests", client="yt-dlp") - requests_before == 3
+
+
+def test_sessions_share_one_cookie_jar(server_url):
+    first, second = YtDlpSession(), YtDlpSession()
+    first.ydl.urlopen(server_url).read()
+
+    assert first.ydl.cookiejar is second.ydl.cookiejar is YtDlpSession.cookiejar
+    assert any(cookie.name == "session" for cookie in second.ydl.cookiejar)